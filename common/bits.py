@@ -0,0 +1,4 @@
+import numpy as np
+
+# number of set bits in every byte value, to count the set bits of packed arrays byte by byte
+POPCOUNT_TABLE = np.array([bin(byte).count("1") for byte in range(256)], dtype=np.uint8)
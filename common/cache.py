@@ -0,0 +1,49 @@
+import hashlib
+import json
+import os
+
+
+def file_hash(path):
+    """The sha256 of the contents of a file"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_base(path, directory):
+    """The path of the cache of a source file without its extension, in the given cache directory next to the file"""
+    return os.path.join(os.path.dirname(os.path.abspath(path)), directory, os.path.basename(path))
+
+
+def is_valid(metadata_path, path, options=None):
+    """
+    Check if the cache of a source file is still valid: it was parsed with the same options, and the source has the
+    same size and modification time, or if it was only touched, the same hash. In the last case the cached modification
+    time is refreshed, so the file is not hashed again next time.
+    """
+    try:
+        with open(metadata_path) as file:
+            metadata = json.load(file)
+    except FileNotFoundError:
+        return False
+    stat = os.stat(path)
+    if metadata.get("options") != options or metadata["size"] != stat.st_size:
+        return False
+    if metadata["mtime_ns"] == stat.st_mtime_ns:
+        return True
+    if metadata["sha256"] != file_hash(path):
+        return False
+    metadata["mtime_ns"] = stat.st_mtime_ns
+    with open(metadata_path, "w") as file:
+        json.dump(metadata, file)
+    return True
+
+
+def write_metadata(metadata_path, path, options=None):
+    """Write the metadata of the cache of a source file, that is_valid checks it by"""
+    stat = os.stat(path)
+    with open(metadata_path, "w") as file:
+        json.dump({"source": os.path.abspath(path), "options": options, "size": stat.st_size,
+                   "mtime_ns": stat.st_mtime_ns, "sha256": file_hash(path)}, file)
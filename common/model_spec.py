@@ -0,0 +1,117 @@
+import hashlib
+import importlib.util
+import json
+import os
+
+CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".model_cache")
+# bump when the generated code changes, so kernels generated by an older version are not reused
+GENERATOR_VERSION = 1
+
+
+class Model:
+    """
+    An ODE model declared once, as species, parameters and a rate law for every species, written as an expression of
+    them. The right hand side, its exact jacobian by the species and by the parameters are derived symbolically with
+    sympy and generated as numpy kernels that take the state and parameters as arrays, so a whole batch is evaluated
+    in one call. The generated code is cached on disk by a hash of the model, so sympy is only needed the first time.
+    """
+    def __init__(self, name, species, parameters, rates):
+        """
+        :param name: Name of the model, for the cache file
+        :param species: Names of the species, in the order of the state
+        :param parameters: Names of the parameters
+        :param rates: Species name to its rate law, an expression of species and parameters, e.g. "k * a - d * b"
+        """
+        if set(rates) != set(species):
+            raise ValueError("Every species needs exactly one rate law!")
+        self.name = name
+        self.species = tuple(species)
+        self.parameters = tuple(parameters)
+        self.rates = {name: rates[name] for name in self.species}
+        self.key = model_hash(self)
+        kernels = load_kernels(self)
+        self.rhs = kernels.rhs
+        self.jacobian = kernels.jacobian
+        self.parameter_jacobian = kernels.parameter_jacobian
+
+
+def model_hash(model):
+    description = {"species": model.species, "parameters": model.parameters, "rates": model.rates,
+                   "version": GENERATOR_VERSION}
+    return hashlib.sha256(json.dumps(description, sort_keys=True).encode()).hexdigest()[:16]
+
+
+def load_kernels(model):
+    """Import the generated kernels of the model, generating and caching them first if they are not cached yet"""
+    path = os.path.join(CACHE_DIRECTORY, f"{model.name}_{model.key}.py")
+    if not os.path.exists(path):
+        os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+        # write to a temporary file first, so a process that reads the cache never sees half a file
+        temporary = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as file:
+            file.write(generate_source(model))
+        os.replace(temporary, path)
+    spec = importlib.util.spec_from_file_location(f"{model.name}_{model.key}", path)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def generate_source(model):
+    """
+    Derive the kernels of the model with sympy and print them as python source. Every kernel takes the state, with
+    the species along the first axis, and a mapping of parameter name to value, and broadcasts them together:
+    rhs returns (species, ...), jacobian (species, species, ...) where [i, j] is the derivative of the rate of species
+    i by species j, and parameter_jacobian (species, parameters, ...) in the order of model.parameters.
+    """
+    import sympy
+    from sympy.printing.numpy import NumPyPrinter
+
+    symbols = {name: sympy.Symbol(name) for name in model.species + model.parameters}
+    rates = [sympy.sympify(model.rates[name], locals=symbols) for name in model.species]
+    unknown = set().union(*[rate.free_symbols for rate in rates]) - set(symbols.values())
+    if unknown:
+        raise ValueError(f"Unknown names in the rate laws: {', '.join(sorted(map(str, unknown)))}")
+
+    species = [symbols[name] for name in model.species]
+    parameters = [symbols[name] for name in model.parameters]
+    kernels = {
+        "rhs": rates,
+        "jacobian": [[sympy.diff(rate, s) for s in species] for rate in rates],
+        "parameter_jacobian": [[sympy.diff(rate, p) for p in parameters] for rate in rates],
+    }
+    printer = NumPyPrinter()
+    lines = [f"# Generated from the model {model.name} by model_spec, do not edit", "import numpy", ""]
+    for kernel, entries in kernels.items():
+        flat = list(sympy.flatten(entries))
+        replacements, reduced = sympy.cse(flat, symbols=sympy.numbered_symbols("_common"))
+        used = set().union(*[entry.free_symbols for entry in flat])
+        lines += ["", f"def {kernel}(state, p):",
+                  f"    {', '.join(model.species)}{',' if len(model.species) == 1 else ''} = state"]
+        # parameters as floats, so flags like a boolean treatment take part in the arithmetic
+        lines += [f"    {name} = numpy.asarray(p[{name!r}], dtype=float)" for name in model.parameters
+                  if symbols[name] in used]
+        body = [f"{symbol} = {printer.doprint(value)}" for symbol, value in replacements]
+        body += [f"_entry{k} = {printer.doprint(entry)}" for k, entry in enumerate(reduced)]
+        if any(entry.has(sympy.Piecewise) for entry in flat):
+            # every branch of a piecewise law is evaluated everywhere, also where it divides by zero and is not used
+            lines.append('    with numpy.errstate(divide="ignore", invalid="ignore"):')
+            lines += [f"        {line}" for line in body]
+        else:
+            lines += [f"    {line}" for line in body]
+        # the entries are written into an array of the shape of the inputs, so constant entries are broadcast too
+        names = [f"_entry{k}" for k in range(len(reduced))] + list(model.species)
+        shape = (f"numpy.broadcast({', '.join(names)}).shape" if len(names) <= 32 else
+                 f"numpy.broadcast_shapes({', '.join(f'numpy.shape({name})' for name in names)})")
+        lines.append(f"    result = numpy.empty({numpy_shape(entries)} + {shape})")
+        indices = [(i,) for i in range(len(entries))] if kernel == "rhs" else \
+            [(i, j) for i in range(len(entries)) for j in range(len(entries[i]))]
+        lines += [f"    result[{', '.join(map(str, index))}] = _entry{k}" for k, index in enumerate(indices)]
+        lines += ["    return result", ""]
+    return "\n".join(lines)
+
+
+def numpy_shape(entries):
+    # the leading shape of a kernel, (species,) for a list of entries and (species, columns) for a list of rows
+    return f"({len(entries)},)" if not entries or not isinstance(entries[0], list) else \
+        f"({len(entries)}, {len(entries[0])})"
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+
+import plotly.io as pio
+
+CACHE_DIRECTORY = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".render_cache")
+# set this environment variable to 1 to skip the interactive show() of every figure, for batch runs
+BATCH_VARIABLE = "RENDER_BATCH"
+IMAGE_FORMATS = ("png", "jpg", "jpeg", "webp", "svg", "pdf")
+
+
+def batch_mode():
+    """Whether the figures are rendered in a batch run, where nobody looks at them interactively"""
+    return os.environ.get(BATCH_VARIABLE, "") not in ("", "0")
+
+
+def figure_key(figure_json, extension, options):
+    """The hash of everything an output depends on: the data and layout of the figure, the format and its options"""
+    description = json.dumps({"figure": figure_json, "extension": extension, "options": options}, sort_keys=True)
+    return hashlib.sha256(description.encode()).hexdigest()
+
+
+def output_format(path):
+    """The format of the output file, by its extension"""
+    extension = os.path.splitext(path)[1].lstrip(".").lower()
+    if extension != "html" and extension not in IMAGE_FORMATS:
+        raise ValueError(f"Figures can be written as html or one of {', '.join(IMAGE_FORMATS)}, not {path}")
+    return extension
+
+
+def render_file(figure_json, path, options):
+    """
+    Write the figure to path, in the format of its extension, html or one of IMAGE_FORMATS. The output is rendered
+    once into the cache, keyed by figure_key, and copied from there, so an unchanged figure is never rendered again.
+    :param figure_json: The figure, as from plotly's to_json
+    :param options: Keyword arguments for plotly's write_html or write_image
+    :return: Whether the figure was rendered, False if it was taken from the cache
+    """
+    extension = output_format(path)
+    cached = os.path.join(CACHE_DIRECTORY, f"{figure_key(figure_json, extension, options)}.{extension}")
+    rendered = not os.path.exists(cached)
+    if rendered:
+        os.makedirs(CACHE_DIRECTORY, exist_ok=True)
+        fig = pio.from_json(figure_json)
+        # render to a temporary file first, so a worker that reads the cache never sees half a figure
+        temporary = f"{cached}.{os.getpid()}.tmp"
+        if extension == "html":
+            fig.write_html(temporary, **options)
+        else:
+            fig.write_image(temporary, format=extension, **options)
+        os.replace(temporary, cached)
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    shutil.copyfile(cached, path)
+    return rendered
+
+
+class Renderer:
+    """
+    Renders figures from all the modules in a pool of worker processes, so writing them doesn't hold up the
+    simulation that made them. Every figure is sent to the workers as its plotly JSON, which is also what the cache
+    is keyed by. Use as a context manager, leaving it waits for every figure and raises the first error.
+    With workers=0 the figures are rendered in the calling process, when they are saved.
+    """
+    def __init__(self, workers=None):
+        self.executor = None if workers == 0 else ProcessPoolExecutor(max_workers=workers or os.cpu_count())
+        self.futures = []
+        self.rendered = 0
+        self.reused = 0
+
+    def save(self, fig, path, **options):
+        """Write the plotly figure to path, see render_file"""
+        output_format(path)
+        figure_json = fig.to_json()
+        if self.executor is None:
+            self.count(render_file(figure_json, path, options))
+        else:
+            self.futures.append(self.executor.submit(render_file, figure_json, path, options))
+
+    def show(self, fig):
+        """Show the figure interactively, unless in batch mode"""
+        if not batch_mode():
+            fig.show()
+
+    def count(self, rendered):
+        if rendered:
+            self.rendered += 1
+        else:
+            self.reused += 1
+
+    def close(self):
+        """Wait for every figure to be written"""
+        try:
+            for future in self.futures:
+                self.count(future.result())
+        finally:
+            self.futures = []
+            if self.executor is not None:
+                self.executor.shutdown()
+                self.executor = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -1,11 +1,33 @@
+import hashlib
+
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
+
+
+def count_neighbours(cells: np.ndarray) -> np.ndarray:
+    """
+    Returns the number of neighbours of every cell, using the same 4-neighbour, non-wrapping rule as
+    Board.get_num_neighbours. Works on the last two axes, so a stack of boards can be counted at once.
+    """
+    neighbours = np.zeros(cells.shape, dtype=np.int8)
+    neighbours[..., 1:, :] += cells[..., :-1, :]
+    neighbours[..., :-1, :] += cells[..., 1:, :]
+    neighbours[..., :, 1:] += cells[..., :, :-1]
+    neighbours[..., :, :-1] += cells[..., :, 1:]
+    return neighbours
+
+
+def life_rule(cells: np.ndarray, neighbours: np.ndarray) -> np.ndarray:
+    """Returns the next state of the cells, using the rules of Game of Life, as one array expression"""
+    # a cell is alive next turn if it has exactly 3 neighbours, or if it is alive and has exactly 2
+    return ((neighbours == 3) | ((cells == 1) & (neighbours == 2))).astype(cells.dtype)
+
+
 class Board:
     def __init__(self, size: int):
         self.size = size
         self.board = np.zeros((size, size), dtype=int)
-        self.fig, self.ax = plt.subplots()
+        # matplotlib is only imported once the board is first printed, so headless runs never load it
+        self.fig, self.ax = None, None
 
     def get_board(self) -> np.ndarray:
         return self.board
@@ -43,11 +65,33 @@ class Board:
             neighbours += self.board[x, y+1]
         return neighbours
 
+    def get_neighbours_counts(self) -> np.ndarray:
+        """Returns the number of neighbours of all cells of the board at once"""
+        return count_neighbours(self.board)
+
+    def step(self) -> bool:
+        """Advances the whole board by one generation, returns whether any cell changed"""
+        new_board = life_rule(self.board, self.get_neighbours_counts())
+        changed = not np.array_equal(new_board, self.board)
+        self.board = new_board
+        return changed
+
+    def get_packed(self) -> np.ndarray:
+        """Returns the board packed to bits, each row as bytes where cell y is bit y % 8 of byte y // 8"""
+        return np.packbits(self.board.astype(bool), axis=1, bitorder="little")
+
+    def fingerprint(self) -> bytes:
+        """Returns a 128 bit hash of the state of the board"""
+        return hashlib.blake2b(self.get_packed().tobytes(), digest_size=16).digest()
+
     def reset_board(self) -> None:
         self.set_board(np.zeros((self.size, self.size), dtype=int))
 
     def print_board(self) -> None:
         """prints the board nicely to the console"""
+        import matplotlib.pyplot as plt
+        if self.fig is None:
+            self.fig, self.ax = plt.subplots()
         # plt.clf()
         self.ax.imshow(self.board, cmap=plt.cm.binary)
         plt.pause(0.5)
@@ -0,0 +1,147 @@
+import argparse
+import csv
+import hashlib
+import itertools
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from Board import count_neighbours, life_rule
+from Game import TURNS, HISTORY_SIZE
+
+BATCH_SIZE = 64
+SUMMARY_FIELDS = ["board_size", "begin_alive", "seed", "final_generation", "stop_reason", "period", "cycle_start",
+                  "live_cells"]
+
+
+def random_boards(board_size: int, begin_alive: int, seeds) -> np.ndarray:
+    """
+    Returns a (len(seeds), board_size, board_size) stack of random boards. Every board gets its own RNG stream,
+    derived from its seed and parameters, so a run is reproducible no matter which batch or worker it ran in.
+    """
+    boards = np.zeros((len(seeds), board_size, board_size), dtype=np.int8)
+    for board, seed in zip(boards, seeds):
+        rng = np.random.default_rng(np.random.SeedSequence([seed, board_size, begin_alive]))
+        on_indices = rng.choice(board_size**2, begin_alive, replace=False)
+        board[np.unravel_index(on_indices, (board_size, board_size))] = 1
+    return boards
+
+
+def fingerprint(board: np.ndarray) -> bytes:
+    """Returns a 128 bit hash of the state of a board, as Board.fingerprint does"""
+    return hashlib.blake2b(np.packbits(board.astype(bool), axis=1, bitorder="little").tobytes(),
+                           digest_size=16).digest()
+
+
+def run_batch(board_size: int, begin_alive: int, seeds, turns: int = TURNS) -> list:
+    """
+    Runs one game per seed, stepping all boards together as one stacked array, with the same stopping rules as
+    Game.run. Returns a summary of every run.
+    """
+    boards = random_boards(board_size, begin_alive, seeds)
+    summaries = [{"board_size": board_size, "begin_alive": begin_alive, "seed": seed, "final_generation": 0,
+                  "stop_reason": "turns", "period": None, "cycle_start": None,
+                  "live_cells": [int(np.sum(board))]} for seed, board in zip(seeds, boards)]
+    histories = [{fingerprint(board): 0} for board in boards]
+    history_orders = [deque(history) for history in histories]
+    # index in summaries of every board that is still running
+    running = np.arange(len(seeds))
+
+    for generation in range(1, turns + 1):
+        if len(running) == 0:
+            break
+        boards = life_rule(boards, count_neighbours(boards))
+        live_cells = np.sum(boards, axis=(1, 2))
+        still_running = np.ones(len(running), dtype=bool)
+        for k, run in enumerate(running):
+            summary = summaries[run]
+            summary["final_generation"] = generation
+            summary["live_cells"].append(int(live_cells[k]))
+            if live_cells[k] == 0:
+                summary["stop_reason"] = "dead"
+                still_running[k] = False
+                continue
+
+            board_fingerprint = fingerprint(boards[k])
+            history, history_order = histories[run], history_orders[run]
+            if board_fingerprint in history:
+                summary["cycle_start"] = history[board_fingerprint]
+                summary["period"] = generation - summary["cycle_start"]
+                summary["stop_reason"] = "stable" if summary["period"] == 1 else "oscillating"
+                still_running[k] = False
+                continue
+            history[board_fingerprint] = generation
+            history_order.append(board_fingerprint)
+            if len(history_order) > HISTORY_SIZE:
+                del history[history_order.popleft()]
+
+        if not np.all(still_running):
+            boards = boards[still_running]
+            running = running[still_running]
+
+    return summaries
+
+
+def run_ensemble(board_sizes, begin_alives, seeds, turns: int = TURNS, batch_size: int = BATCH_SIZE,
+                 workers: int = None) -> list:
+    """
+    Runs a game for every combination of board size, number of cells that begin alive and seed. Runs with the same
+    parameters are stepped together in batches, and batches are spread over a pool of worker processes.
+    Returns the summaries of all runs, ordered by board size, begin alive and seed.
+    """
+    seeds = list(seeds)
+    tasks = []
+    for board_size, begin_alive in itertools.product(board_sizes, begin_alives):
+        if begin_alive > board_size**2:
+            raise ValueError("Number of cells that begin alive must be smaller than size of board!")
+        for start in range(0, len(seeds), batch_size):
+            tasks.append((board_size, begin_alive, seeds[start:start + batch_size], turns))
+
+    summaries = []
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for batch in executor.map(run_batch, *zip(*tasks)):
+            summaries.extend(batch)
+    return summaries
+
+
+def write_summary(summaries: list, path: str) -> None:
+    """Writes the summaries of an ensemble to one csv table, with the live cells curve as a ; separated list"""
+    with open(path, "w", newline="") as file:
+        writer = csv.DictWriter(file, fieldnames=SUMMARY_FIELDS)
+        writer.writeheader()
+        for summary in summaries:
+            writer.writerow({**summary, "live_cells": ";".join(map(str, summary["live_cells"]))})
+
+
+def print_summary(summaries: list) -> None:
+    """Prints the mean final generation and the share of every stop reason, for every set of parameters"""
+    key = lambda summary: (summary["board_size"], summary["begin_alive"])
+    for (board_size, begin_alive), group in itertools.groupby(sorted(summaries, key=key), key=key):
+        group = list(group)
+        reasons = [summary["stop_reason"] for summary in group]
+        shares = ", ".join(f"{reason} {reasons.count(reason) / len(group):.2f}" for reason in sorted(set(reasons)))
+        mean_generation = np.mean([summary["final_generation"] for summary in group])
+        print(f"size {board_size}, begin alive {begin_alive}, {len(group)} runs: "
+              f"mean final generation {mean_generation:.1f}, {shares}")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Ensemble of Game of Life simulations from random initializations')
+
+    parser.add_argument('--board_sizes', '-s', type=int, nargs='+', default=[100], help='Sizes of the board edge')
+    parser.add_argument('--begin_alive', '-a', type=int, nargs='+', default=[2500],
+                        help='Numbers of cells that begin alive')
+    parser.add_argument('--runs', '-n', type=int, default=100, help='Number of seeds for every set of parameters')
+    parser.add_argument('--first_seed', type=int, default=0, help='Seed of the first run, the others follow it')
+    parser.add_argument('--turns', '-t', type=int, default=TURNS, help='Maximal number of turns to simulate')
+    parser.add_argument('--batch_size', type=int, default=BATCH_SIZE, help='Number of boards stepped together')
+    parser.add_argument('--workers', '-w', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--output', '-o', default='ensemble.csv', help='Path of the csv table of all runs')
+
+    args = parser.parse_args()
+
+    summaries = run_ensemble(args.board_sizes, args.begin_alive, range(args.first_seed, args.first_seed + args.runs),
+                             args.turns, args.batch_size, args.workers)
+    write_summary(summaries, args.output)
+    print_summary(summaries)
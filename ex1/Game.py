@@ -1,14 +1,29 @@
+from collections import deque
+
 import numpy as np
 
 from Board import Board
+from PackedBoard import PackedBoard
+from TiledBoard import TiledBoard
+from ParallelBoard import ParallelBoard
+from Trajectory import TrajectoryWriter
 
 BOARD_SIZE = 100
 BEGIN_ALIVE = 2500
 TURNS = 10000
+# number of past generations whose fingerprints are kept, cycles longer than that are not detected
+HISTORY_SIZE = 1024
+# "stencil" advances the whole board at once, "reference" is the original cell-by-cell engine, kept for cross-checking
+ENGINES = ("stencil", "reference")
+# board representations, "dense" keeps a full int per cell, "packed" keeps 64 cells per uint64 word,
+# "tiled" only recomputes the tiles of the board that changed in the last generation,
+# "parallel" splits the board to strips advanced by worker processes over shared memory
+BACKENDS = {"dense": Board, "packed": PackedBoard, "tiled": TiledBoard, "parallel": ParallelBoard}
 
 
 class Game:
-    def __init__(self, board_size=BOARD_SIZE, begin_alive=BEGIN_ALIVE, turns=TURNS):
+    def __init__(self, board_size=BOARD_SIZE, begin_alive=BEGIN_ALIVE, turns=TURNS, engine="stencil",
+                 backend="dense", headless=False, trajectory=None, **board_options):
         if board_size < 1:
             raise ValueError("Board size must be at least 1!")
         if begin_alive < 0:
@@ -17,10 +32,24 @@ class Game:
             raise ValueError("Number of cells that begin alive must be smaller than size of board!")
         if turns < 1:
             raise ValueError("Number of turns must be at least 1!")
+        if engine not in ENGINES:
+            raise ValueError(f"Engine must be one of {', '.join(ENGINES)}!")
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend must be one of {', '.join(BACKENDS)}!")
 
-        self.board = Board(board_size)
+        self.board = BACKENDS[backend](board_size, **board_options)
         self.board.random_init(begin_alive)
         self.turns = turns
+        self.engine = engine
+        # a headless game never draws the board, and runs as fast as the engine allows
+        self.headless = headless
+        # path of a file to record every generation to, for replay.py
+        self.trajectory = trajectory
+        # filled in by run: the last generation, why the simulation stopped, and the cycle the board fell into
+        self.generation = 0
+        self.stop_reason = None
+        self.period = None
+        self.cycle_start = None
 
     def new_state(self, index: int) -> int:
         """Returns the new state of a cell, using the rules of Game of Life, and the state of its neighbours"""
@@ -41,27 +70,71 @@ class Game:
                 return 0
 
 
-    def turn(self) -> None:
-
+    def reference_turn(self) -> bool:
+        """Advances the board by one generation, computing every cell separately with new_state"""
         vec_new_state = np.vectorize(self.new_state)
         # Calculate new state of all cells
         new_board = vec_new_state(np.arange(self.board.get_size()**2))
+        new_board = np.reshape(new_board, (self.board.get_size(), self.board.get_size()))
+
+        changed = not np.array_equal(new_board, self.board.get_board())
+        self.board.set_board(new_board)
+        return changed
+
+    def turn(self) -> bool:
+        """Advances the board by one generation, returns whether any cell changed"""
+        if self.engine == "reference":
+            return self.reference_turn()
+        return self.board.step()
 
-        self.board.set_board(np.reshape(new_board, (self.board.get_size(), self.board.get_size())))
+    def show(self, writer) -> None:
+        """Draws the current generation, unless the game is headless, and records it if a trajectory is written"""
+        if not self.headless:
+            self.board.print_board()
+        if writer is not None:
+            writer.write_frame(self.board.get_packed())
 
     def run(self):
+        writer = None if self.trajectory is None else TrajectoryWriter(self.trajectory, self.board.get_size())
+        try:
+            self.simulate(writer)
+        finally:
+            if writer is not None:
+                writer.close()
+
+    def simulate(self, writer):
+        # generation in which every recent state was first seen, keyed by the fingerprint of the board
+        history = {self.board.fingerprint(): 0}
+        history_order = deque(history)
+        self.stop_reason = "turns"
+        self.show(writer)
         for i in range(self.turns):
-            old_board = self.board.get_board().copy()
-            self.board.print_board()
-            self.turn()
+            changed = self.turn()
+            self.generation = i + 1
+            self.show(writer)
             if self.board.board_sum() == 0:
+                self.stop_reason = "dead"
                 print("All cells are dead! Simulation over.")
                 break
-            if np.array_equal(old_board, self.board.get_board()):
+            if not changed:
+                # a board that didn't change is a cycle of period 1, found without hashing it
+                self.cycle_start, self.period = self.generation - 1, 1
+                self.stop_reason = "stable"
                 print("Board is stable! Simulation over.")
                 break
 
-        self.board.print_board()
+            fingerprint = self.board.fingerprint()
+            if fingerprint in history:
+                self.cycle_start = history[fingerprint]
+                self.period = self.generation - self.cycle_start
+                self.stop_reason = "oscillating"
+                print(f"Board is oscillating with period {self.period}, since generation {self.cycle_start}! "
+                      f"Simulation over.")
+                break
+            history[fingerprint] = self.generation
+            history_order.append(fingerprint)
+            if len(history_order) > HISTORY_SIZE:
+                del history[history_order.popleft()]
 
 
 
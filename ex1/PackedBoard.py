@@ -0,0 +1,166 @@
+import hashlib
+
+import numpy as np
+
+import common_path  # puts the shared modules of common/ on the path
+from bits import POPCOUNT_TABLE
+
+WORD_BITS = 64
+# number of rows advanced together in step, bounds the memory used by the temporary bitplanes on big boards
+BLOCK_ROWS = 1024
+
+
+def popcount(words: np.ndarray) -> int:
+    """Returns the number of set bits in an array of words, by POPCOUNT_TABLE when np.bitwise_count is not available"""
+    if hasattr(np, "bitwise_count"):
+        return int(np.sum(np.bitwise_count(words), dtype=np.int64))
+    return int(np.sum(POPCOUNT_TABLE[words.view(np.uint8)], dtype=np.int64))
+
+
+class PackedBoard:
+    """
+    A Game of Life board that stores every row as a bitplane of uint64 words, so cell y of row x is bit y % 64 of
+    word y // 64. The next generation is computed with bitwise adders, advancing 64 cells per machine operation.
+    Exposes the same API as Board, so it can be used by Game as is.
+    """
+    def __init__(self, size: int):
+        self.size = size
+        self.num_words = -(-size // WORD_BITS)
+        self.words = np.zeros((size, self.num_words), dtype=np.uint64)
+        # bits of the last word that are past the edge of the board, they must always stay 0
+        self.last_word_mask = np.uint64((1 << (size - (self.num_words - 1) * WORD_BITS)) - 1)
+        # matplotlib is only imported once the board is first printed, so headless runs never load it
+        self.fig, self.ax = None, None
+
+    def pack(self, board: np.ndarray) -> np.ndarray:
+        """Packs a (size, size) array of 0's and 1's to rows of uint64 words"""
+        packed = np.zeros((self.size, self.num_words * 8), dtype=np.uint8)
+        packed[:, :-(-self.size // 8)] = np.packbits(board.astype(bool), axis=1, bitorder="little")
+        return packed.view("<u8").astype(np.uint64, copy=False)
+
+    def unpack(self) -> np.ndarray:
+        """Unpacks the words to a (size, size) array of 0's and 1's"""
+        bits = np.unpackbits(self.words.astype("<u8", copy=False).view(np.uint8), axis=1, bitorder="little")
+        return bits[:, :self.size].astype(int)
+
+    def get_board(self) -> np.ndarray:
+        return self.unpack()
+
+    def get_packed(self) -> np.ndarray:
+        """Returns the board packed to bits, each row as bytes where cell y is bit y % 8 of byte y // 8"""
+        return self.words.astype("<u8", copy=False).view(np.uint8)[:, :-(-self.size // 8)]
+
+    def fingerprint(self) -> bytes:
+        """Returns a 128 bit hash of the state of the board, equal to the one of a Board in the same state"""
+        return hashlib.blake2b(np.ascontiguousarray(self.get_packed()).tobytes(), digest_size=16).digest()
+
+    def get_size(self) -> int:
+        return self.size
+
+    def set_board(self, board: np.ndarray) -> None:
+        self.words = self.pack(board)
+
+    def set_size(self, size: int) -> None:
+        self.size = size
+        self.num_words = -(-size // WORD_BITS)
+        self.last_word_mask = np.uint64((1 << (size - (self.num_words - 1) * WORD_BITS)) - 1)
+        self.reset_board()
+
+    def get_value(self, x: int, y: int) -> int:
+        return int((self.words[x, y // WORD_BITS] >> np.uint64(y % WORD_BITS)) & np.uint64(1))
+
+    def set_value(self, x: int, y: int, value: int) -> None:
+        bit = np.uint64(1) << np.uint64(y % WORD_BITS)
+        if value:
+            self.words[x, y // WORD_BITS] |= bit
+        else:
+            self.words[x, y // WORD_BITS] &= ~bit
+
+    def random_init(self, num_on: int) -> None:
+        self.reset_board()
+        # draw the cells the same way Board does, so both boards start from the same state for the same seed
+        on_indices = np.random.choice(self.size**2, num_on, replace=False)
+        x, y = np.unravel_index(on_indices, (self.size, self.size))
+        np.bitwise_or.at(self.words, (x, y // WORD_BITS), np.uint64(1) << (y % WORD_BITS).astype(np.uint64))
+
+    def get_num_neighbours(self, x: int, y: int) -> int:
+        """Returns the number of neighbours of a cell"""
+        neighbours = 0
+        if x > 0:
+            neighbours += self.get_value(x-1, y)
+        if x < self.size - 1:
+            neighbours += self.get_value(x+1, y)
+        if y > 0:
+            neighbours += self.get_value(x, y-1)
+        if y < self.size - 1:
+            neighbours += self.get_value(x, y+1)
+        return neighbours
+
+    def get_neighbours_counts(self) -> np.ndarray:
+        """Returns the number of neighbours of all cells of the board at once"""
+        bit0, bit1, bit2 = self.neighbour_count_bits()
+        counts = np.zeros((self.size, self.size), dtype=np.int8)
+        for weight, plane in ((1, bit0), (2, bit1), (4, bit2)):
+            bits = np.unpackbits(plane.astype("<u8", copy=False).view(np.uint8), axis=1, bitorder="little")
+            counts += weight * bits[:, :self.size].astype(np.int8)
+        return counts
+
+    def neighbour_count_bits(self, start: int = 0, stop: int = None):
+        """
+        Returns the binary digits of the number of neighbours of every cell in rows start to stop, as three
+        bitplanes. The four neighbours are summed with two half adders and a full adder, all cells of a word at once.
+        """
+        stop = self.size if stop is None else stop
+        one = np.uint64(1)
+        top_bit = np.uint64(WORD_BITS - 1)
+        words = self.words[start:stop]
+        up = np.zeros_like(words)
+        up[1:] = words[:-1]
+        if start > 0:
+            up[0] = self.words[start - 1]
+        down = np.zeros_like(words)
+        down[:-1] = words[1:]
+        if stop < self.size:
+            down[-1] = self.words[stop]
+        # the neighbour to the left of bit y is bit y - 1, so shift the row up by one bit, carrying across words
+        left = words << one
+        left[:, 1:] |= words[:, :-1] >> top_bit
+        right = words >> one
+        right[:, :-1] |= words[:, 1:] << top_bit
+
+        sum_a, carry_a = up ^ down, up & down
+        sum_b, carry_b = left ^ right, left & right
+        bit0 = sum_a ^ sum_b
+        carry_0 = sum_a & sum_b
+        bit1 = carry_a ^ carry_b ^ carry_0
+        bit2 = (carry_a & carry_b) | (carry_0 & (carry_a | carry_b))
+        return bit0, bit1, bit2
+
+    def step(self) -> bool:
+        """Advances the whole board by one generation, returns whether any cell changed"""
+        new_words = np.empty_like(self.words)
+        changed = False
+        for start in range(0, self.size, BLOCK_ROWS):
+            stop = min(start + BLOCK_ROWS, self.size)
+            bit0, bit1, bit2 = self.neighbour_count_bits(start, stop)
+            # alive next turn with 3 neighbours (0b011), or alive now with 2 neighbours (0b010)
+            block = bit1 & ~bit2 & (bit0 | self.words[start:stop])
+            block[:, -1] &= self.last_word_mask
+            changed = changed or not np.array_equal(block, self.words[start:stop])
+            new_words[start:stop] = block
+        self.words = new_words
+        return changed
+
+    def reset_board(self) -> None:
+        self.words = np.zeros((self.size, self.num_words), dtype=np.uint64)
+
+    def print_board(self) -> None:
+        """prints the board nicely to the console"""
+        import matplotlib.pyplot as plt
+        if self.fig is None:
+            self.fig, self.ax = plt.subplots()
+        self.ax.imshow(self.unpack(), cmap=plt.cm.binary)
+        plt.pause(0.5)
+
+    def board_sum(self):
+        return popcount(self.words)
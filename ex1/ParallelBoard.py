@@ -0,0 +1,227 @@
+import argparse
+import hashlib
+import multiprocessing as mp
+import time
+import weakref
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from Board import Board, count_neighbours, life_rule
+
+WORKERS = 2
+# commands the main process gives the workers at every generation
+STEP, STOP = 0, 1
+# values every worker reports per generation: live cells, changed flag, and the two halves of the hash of its strip
+RESULTS_PER_WORKER = 4
+
+
+def strip_bounds(size: int, workers: int) -> list:
+    """Splits the rows of the board to horizontal strips of nearly equal height, one per worker"""
+    edges = np.linspace(0, size, workers + 1).astype(int)
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def strip_hash(rows: np.ndarray) -> tuple:
+    """Returns a 128 bit hash of rows of the board, as two signed 64 bit integers that fit the shared results"""
+    digest = hashlib.blake2b(np.packbits(rows, axis=1, bitorder="little").tobytes(), digest_size=16).digest()
+    return (int.from_bytes(digest[:8], "little", signed=True), int.from_bytes(digest[8:], "little", signed=True))
+
+
+def combine_hashes(hashes) -> bytes:
+    """Returns the fingerprint of the board from the hashes of its strips, in order"""
+    return hashlib.blake2b(b"".join(int(value).to_bytes(8, "little", signed=True) for value in hashes),
+                           digest_size=16).digest()
+
+
+def advance_strip(current: np.ndarray, following: np.ndarray, start: int, stop: int):
+    """
+    Writes the next state of rows start to stop of the current board to the following board. Reads the row above and
+    below the strip too, as the halo that belongs to the neighbouring strips. Returns the live cells of the strip,
+    whether it changed, and the hash of the new strip.
+    """
+    halo_start = max(start - 1, 0)
+    strip = current[halo_start:stop + 1]
+    rows = slice(start - halo_start, stop - halo_start)
+    new_strip = life_rule(strip[rows], count_neighbours(strip)[rows])
+    following[start:stop] = new_strip
+    return int(np.sum(new_strip)), not np.array_equal(new_strip, strip[rows]), strip_hash(new_strip)
+
+
+def worker_loop(names, size, start, stop, worker, control, results, start_barrier, done_barrier) -> None:
+    """
+    Advances the rows start to stop of the board at every generation. The board is double buffered in two shared
+    memory blocks, the worker reads the current one and writes its strip of the other one. Its live cell count,
+    changed flag and strip hash go to results, for the main process to reduce.
+    """
+    memories = [shared_memory.SharedMemory(name=name) for name in names]
+    buffers = [np.ndarray((size, size), dtype=np.int8, buffer=memory.buf) for memory in memories]
+    try:
+        while True:
+            start_barrier.wait()
+            command, parity = control[0], control[1]
+            if command == STOP:
+                break
+            live_cells, changed, (low, high) = advance_strip(buffers[parity], buffers[1 - parity], start, stop)
+            offset = RESULTS_PER_WORKER * worker
+            results[offset:offset + RESULTS_PER_WORKER] = [live_cells, changed, low, high]
+            done_barrier.wait()
+    finally:
+        # the arrays must be released before the shared memory can be closed
+        buffers = None
+        for memory in memories:
+            memory.close()
+
+
+def shutdown(processes, memories, control, start_barrier) -> None:
+    """Stops the workers and frees the shared memory of a ParallelBoard"""
+    if any(process.is_alive() for process in processes):
+        control[0] = STOP
+        start_barrier.wait()
+    for process in processes:
+        process.join()
+    for memory in memories:
+        try:
+            memory.close()
+        except BufferError:
+            # the board still points into the memory when this runs at exit, it is freed by unlink anyway
+            pass
+        memory.unlink()
+
+
+class ParallelBoard(Board):
+    """
+    A Board that is split into horizontal strips, each advanced by its own worker process. The board lives in shared
+    memory, so only the one row halos between strips are exchanged, through the shared buffer, and the board is never
+    pickled. The live cell count, the changed flag and the fingerprint are reduced from the workers every generation,
+    the fingerprint by hashing the hashes of the strips.
+    Results are bit identical to Board.step.
+    """
+    def __init__(self, size: int, workers: int = WORKERS):
+        if workers < 1:
+            raise ValueError("Number of workers must be at least 1!")
+        if workers > size:
+            raise ValueError("Number of workers must be at most the size of the board!")
+        super().__init__(size)
+        self.workers = workers
+        self.memories = [shared_memory.SharedMemory(create=True, size=size * size) for _ in range(2)]
+        self.buffers = [np.ndarray((size, size), dtype=np.int8, buffer=memory.buf) for memory in self.memories]
+        for buffer in self.buffers:
+            buffer[...] = 0
+        self.parity = 0
+        self.board = self.buffers[self.parity]
+        self.live_cells = 0
+        self.bounds = strip_bounds(size, workers)
+        # the hash of every strip, as in the results of the workers, None when the board was changed from outside
+        self.strip_hashes = None
+
+        # control holds the command and the index of the current buffer, results the RESULTS_PER_WORKER values of
+        # every worker
+        self.control = mp.Array("q", 2, lock=False)
+        self.results = mp.Array("q", RESULTS_PER_WORKER * workers, lock=False)
+        self.start_barrier = mp.Barrier(workers + 1)
+        self.done_barrier = mp.Barrier(workers + 1)
+        names = [memory.name for memory in self.memories]
+        self.processes = [mp.Process(target=worker_loop, daemon=True,
+                                     args=(names, size, start, stop, worker, self.control, self.results,
+                                           self.start_barrier, self.done_barrier))
+                          for worker, (start, stop) in enumerate(self.bounds)]
+        for process in self.processes:
+            process.start()
+        self.finalizer = weakref.finalize(self, shutdown, self.processes, self.memories, self.control,
+                                          self.start_barrier)
+
+    def set_board(self, board: np.ndarray) -> None:
+        self.board[...] = board
+        self.live_cells, self.strip_hashes = None, None
+
+    def set_size(self, size: int) -> None:
+        raise ValueError("The size of a ParallelBoard can't be changed!")
+
+    def set_value(self, x: int, y: int, value: int) -> None:
+        self.board[x, y] = value
+        self.live_cells, self.strip_hashes = None, None
+
+    def random_init(self, num_on: int) -> None:
+        super().random_init(num_on)
+        self.live_cells, self.strip_hashes = None, None
+
+    def step(self) -> bool:
+        """Advances the whole board by one generation on the workers, returns whether any cell changed"""
+        self.control[0], self.control[1] = STEP, self.parity
+        self.start_barrier.wait()
+        self.done_barrier.wait()
+        self.parity = 1 - self.parity
+        self.board = self.buffers[self.parity]
+        self.live_cells = sum(self.results[0::RESULTS_PER_WORKER])
+        self.strip_hashes = [value for worker in range(self.workers) for value in
+                             self.results[RESULTS_PER_WORKER * worker + 2:RESULTS_PER_WORKER * (worker + 1)]]
+        return any(self.results[1::RESULTS_PER_WORKER])
+
+    def fingerprint(self) -> bytes:
+        """
+        Returns a 128 bit hash of the state of the board, combined from the hashes of the strips that the workers
+        computed, so the board is not hashed again by the main process after a step
+        """
+        if self.strip_hashes is None:
+            self.strip_hashes = [value for start, stop in self.bounds for value in strip_hash(self.board[start:stop])]
+        return combine_hashes(self.strip_hashes)
+
+    def board_sum(self):
+        if self.live_cells is None:
+            self.live_cells = int(np.sum(self.board))
+        return self.live_cells
+
+    def close(self) -> None:
+        """Stops the workers and frees the shared memory, the board can't be used after that"""
+        self.board = self.board.copy()
+        self.buffers = []
+        self.finalizer()
+
+
+def scaling_report(size: int, begin_alive: int, worker_counts, generations: int, seed: int = 0) -> list:
+    """
+    Times the same run on ParallelBoards with every number of workers, checks the boards end up bit identical to a
+    single process Board, and prints the time per generation and the speedup of every number of workers. The speedup
+    is against a ParallelBoard with one worker, which runs on the same int8 buffers, so it measures the scaling with
+    the workers alone and not the smaller cells.
+    """
+    np.random.seed(seed)
+    reference = Board(size)
+    reference.random_init(begin_alive)
+    initial = reference.get_board().copy()
+    for _ in range(generations):
+        reference.step()
+
+    print(f"{'workers':>8} {'ms/generation':>14} {'speedup':>8}")
+    report = []
+    baseline_time = None
+    for workers in [1] + [workers for workers in worker_counts if workers != 1]:
+        board = ParallelBoard(size, workers)
+        board.set_board(initial)
+        start = time.perf_counter()
+        for _ in range(generations):
+            board.step()
+        parallel_time = (time.perf_counter() - start) / generations
+        if not np.array_equal(board.get_board(), reference.get_board()):
+            raise RuntimeError(f"Board advanced by {workers} workers differs from the single process board!")
+        board.close()
+        baseline_time = parallel_time if baseline_time is None else baseline_time
+        report.append((workers, parallel_time, baseline_time / parallel_time))
+        print(f"{workers:>8} {1000 * parallel_time:>14.2f} {baseline_time / parallel_time:>8.2f}")
+    return report
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Speedup of the strip decomposed board versus number of workers')
+
+    parser.add_argument('--board_size', '-s', type=int, default=4000, help='Size of the board edge')
+    parser.add_argument('--begin_alive', '-a', type=int, default=None,
+                        help='Number of cells that begin alive, defaults to a quarter of the board')
+    parser.add_argument('--workers', '-w', type=int, nargs='+', default=[1, 2, 4, 8], help='Numbers of workers')
+    parser.add_argument('--generations', '-g', type=int, default=20, help='Number of generations to time')
+
+    args = parser.parse_args()
+
+    begin_alive = args.begin_alive if args.begin_alive is not None else args.board_size**2 // 4
+    scaling_report(args.board_size, begin_alive, args.workers, args.generations)
@@ -0,0 +1,115 @@
+import hashlib
+
+import numpy as np
+
+from Board import Board, count_neighbours, life_rule
+
+TILE_SIZE = 16
+
+
+class TiledBoard(Board):
+    """
+    A Board that is split into square tiles, and only recomputes the tiles that changed in the last generation and
+    their neighbours. Since a cell only sees its 4 direct neighbours, no other tile can change in the next generation,
+    so the cost of a generation scales with the activity on the board rather than with its area.
+    The number of live cells is kept up to date incrementally, from the tiles that were recomputed.
+    """
+    def __init__(self, size: int, tile_size: int = TILE_SIZE):
+        if tile_size < 1:
+            raise ValueError("Tile size must be at least 1!")
+        self.tile_size = tile_size
+        self.num_tiles = -(-size // tile_size)
+        # the cells are kept inside a zero frame, one cell wide around the board and padded up to a whole number of
+        # tiles, so every tile can be read together with its halo. Cells of the frame can never come alive.
+        self.padded = np.zeros((self.num_tiles * tile_size + 2,) * 2, dtype=int)
+        self.active = np.ones((self.num_tiles, self.num_tiles), dtype=bool)
+        self.live_cells = 0
+        # hash of every tile, and the xor of all of them, which is the fingerprint of the whole board
+        self.tile_hashes = np.zeros((self.num_tiles, self.num_tiles), dtype=object)
+        self.board_hash = 0
+        # number of tiles recomputed in every generation
+        self.active_tiles_history = []
+        super().__init__(size)
+        self.board = self.padded[1:size + 1, 1:size + 1]
+        self.refresh()
+
+    def set_board(self, board: np.ndarray) -> None:
+        self.board[...] = board
+        self.refresh()
+
+    def set_size(self, size: int) -> None:
+        self.__init__(size, self.tile_size)
+
+    def set_value(self, x: int, y: int, value: int) -> None:
+        self.live_cells += value - self.board[x, y]
+        self.board[x, y] = value
+        self.active[x // self.tile_size, y // self.tile_size] = True
+        self.update_hashes([x // self.tile_size], [y // self.tile_size])
+
+    def random_init(self, num_on: int) -> None:
+        super().random_init(num_on)
+        self.refresh()
+
+    def refresh(self) -> None:
+        """Marks all tiles as active and recounts the live cells, after the board was changed from outside"""
+        self.active[...] = True
+        self.live_cells = int(np.sum(self.board))
+        self.tile_hashes[...] = 0
+        self.board_hash = 0
+        self.update_hashes(*np.nonzero(self.active))
+
+    def tile_hash(self, tile_x: int, tile_y: int) -> int:
+        """Returns a 128 bit hash of the state of a tile and its position"""
+        start_x, start_y = tile_x * self.tile_size + 1, tile_y * self.tile_size + 1
+        tile = self.padded[start_x:start_x + self.tile_size, start_y:start_y + self.tile_size]
+        data = np.array([tile_x, tile_y], dtype=np.int64).tobytes() + np.packbits(tile.astype(bool)).tobytes()
+        return int.from_bytes(hashlib.blake2b(data, digest_size=16).digest(), "little")
+
+    def update_hashes(self, tile_xs, tile_ys) -> None:
+        """Rehashes the given tiles, and updates the fingerprint of the board with the difference"""
+        for tile_x, tile_y in zip(tile_xs, tile_ys):
+            new_hash = self.tile_hash(tile_x, tile_y)
+            self.board_hash ^= self.tile_hashes[tile_x, tile_y] ^ new_hash
+            self.tile_hashes[tile_x, tile_y] = new_hash
+
+    def fingerprint(self) -> bytes:
+        """
+        Returns a 128 bit hash of the state of the board. It is updated incrementally from the tiles that changed,
+        so it differs from the fingerprint of a Board in the same state.
+        """
+        return self.board_hash.to_bytes(16, "little")
+
+    def tiles_to_compute(self) -> np.ndarray:
+        """Returns the coordinates of the active tiles and the tiles next to them"""
+        to_compute = self.active.copy()
+        to_compute[1:, :] |= self.active[:-1, :]
+        to_compute[:-1, :] |= self.active[1:, :]
+        to_compute[:, 1:] |= self.active[:, :-1]
+        to_compute[:, :-1] |= self.active[:, 1:]
+        return np.nonzero(to_compute)
+
+    def step(self) -> bool:
+        """Advances the board by one generation, recomputing only tiles that may change. Returns whether any changed"""
+        tile_x, tile_y = self.tiles_to_compute()
+        self.active_tiles_history.append(len(tile_x))
+        self.active[...] = False
+        if len(tile_x) == 0:
+            return False
+
+        # gather the tiles with their halo to a (tiles, tile_size + 2, tile_size + 2) stack, and advance all at once
+        offsets = np.arange(self.tile_size + 2)
+        rows = (tile_x * self.tile_size)[:, None, None] + offsets[None, :, None]
+        cols = (tile_y * self.tile_size)[:, None, None] + offsets[None, None, :]
+        tiles = self.padded[rows, cols]
+        old = tiles[:, 1:-1, 1:-1]
+        new = life_rule(old, count_neighbours(tiles)[:, 1:-1, 1:-1])
+
+        changed = np.any(new != old, axis=(1, 2))
+        self.active[tile_x[changed], tile_y[changed]] = True
+        self.live_cells += int(np.sum(new[changed]) - np.sum(old[changed]))
+        self.padded[rows[changed, 1:-1], cols[changed, :, 1:-1]] = new[changed]
+        self.update_hashes(tile_x[changed], tile_y[changed])
+        return bool(np.any(changed))
+
+    def board_sum(self):
+        return self.live_cells
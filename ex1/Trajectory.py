@@ -0,0 +1,119 @@
+import mmap
+import struct
+import zlib
+
+import numpy as np
+
+MAGIC = b"GOLT"
+VERSION = 1
+# magic, version, board size, frames per chunk
+HEADER = struct.Struct("<4sHQI")
+# offset of the chunk index, number of chunks, number of frames, magic
+TRAILER = struct.Struct("<QQQ4s")
+CHUNK_FRAMES = 64
+
+
+class TrajectoryWriter:
+    """
+    Streams the generations of a board to a trajectory file. Every frame is bit-packed, frames are grouped to chunks
+    which are compressed with zlib, and an index of the chunks is written at the end of the file, so any generation
+    can be read back later without reading the frames before it.
+    """
+    def __init__(self, path: str, size: int, chunk_frames: int = CHUNK_FRAMES):
+        if chunk_frames < 1:
+            raise ValueError("Number of frames in a chunk must be at least 1!")
+        self.size = size
+        self.chunk_frames = chunk_frames
+        self.file = open(path, "wb")
+        self.file.write(HEADER.pack(MAGIC, VERSION, size, chunk_frames))
+        self.chunk = []
+        self.index = []
+        self.num_frames = 0
+
+    def write_frame(self, packed: np.ndarray) -> None:
+        """Adds a frame, as returned by Board.get_packed"""
+        self.chunk.append(np.ascontiguousarray(packed, dtype=np.uint8).tobytes())
+        self.num_frames += 1
+        if len(self.chunk) == self.chunk_frames:
+            self.flush()
+
+    def flush(self) -> None:
+        """Compresses the frames that were added since the last chunk, and writes them as a new chunk"""
+        if not self.chunk:
+            return
+        data = zlib.compress(b"".join(self.chunk))
+        self.index.append((self.file.tell(), len(data)))
+        self.file.write(data)
+        self.chunk = []
+
+    def close(self) -> None:
+        self.flush()
+        index_offset = self.file.tell()
+        self.file.write(np.array(self.index, dtype="<u8").reshape(-1, 2).tobytes())
+        self.file.write(TRAILER.pack(index_offset, len(self.index), self.num_frames, MAGIC))
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class TrajectoryReader:
+    """
+    Reads frames back from a trajectory file written by TrajectoryWriter. The file is memory mapped, and only the
+    chunk holding the requested generation is decompressed.
+    """
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.size, self.chunk_frames = HEADER.unpack_from(self.map, 0)
+        index_offset, num_chunks, self.num_frames, end_magic = TRAILER.unpack_from(self.map,
+                                                                                    len(self.map) - TRAILER.size)
+        if magic != MAGIC or end_magic != MAGIC:
+            raise ValueError(f"{path} is not a complete trajectory file!")
+        if version != VERSION:
+            raise ValueError(f"Unsupported trajectory version {version}!")
+        self.index = np.frombuffer(self.map, dtype="<u8", count=2 * num_chunks, offset=index_offset).reshape(-1, 2)
+        self.row_bytes = -(-self.size // 8)
+        self.cached_chunk, self.cached_frames = None, None
+
+    def __len__(self) -> int:
+        return self.num_frames
+
+    def read_packed(self, generation: int) -> np.ndarray:
+        """Returns a frame as packed bytes, in the layout of Board.get_packed"""
+        if not 0 <= generation < self.num_frames:
+            raise IndexError(f"Generation {generation} is not in the trajectory!")
+        chunk = generation // self.chunk_frames
+        if chunk != self.cached_chunk:
+            offset, length = (int(value) for value in self.index[chunk])
+            data = zlib.decompress(self.map[offset:offset + length])
+            self.cached_frames = np.frombuffer(data, dtype=np.uint8).reshape(-1, self.size, self.row_bytes)
+            self.cached_chunk = chunk
+        return self.cached_frames[generation % self.chunk_frames]
+
+    def read_frame(self, generation: int) -> np.ndarray:
+        """Returns a frame as a (size, size) array of 0's and 1's"""
+        bits = np.unpackbits(self.read_packed(generation), axis=1, bitorder="little")
+        return bits[:, :self.size].astype(int)
+
+    def __getitem__(self, generation: int) -> np.ndarray:
+        return self.read_frame(generation)
+
+    def __iter__(self):
+        for generation in range(self.num_frames):
+            yield self.read_frame(generation)
+
+    def close(self) -> None:
+        self.index = None
+        self.cached_frames = None
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
@@ -0,0 +1,7 @@
+import os
+import sys
+
+# the directory of the modules shared by all the exercises, the modules here import this one before importing them
+COMMON_DIRECTORY = os.path.abspath(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "common"))
+if COMMON_DIRECTORY not in sys.path:
+    sys.path.append(COMMON_DIRECTORY)
@@ -1,4 +1,4 @@
-from Game import Game
+from Game import Game, ENGINES, BACKENDS
 import argparse
 
 
@@ -8,10 +8,31 @@ if __name__ == '__main__':
     parser.add_argument('--board_size', '-s', type=int, default=100, help='Size of the board edge')
     parser.add_argument('--begin_alive', '-a', type=int, default=2500, help='Number of cells that begin alive')
     parser.add_argument('--turns', '-t', type=int, default=10000, help='Number of turns to simulate')
+    parser.add_argument('--engine', '-e', choices=ENGINES, default='stencil',
+                        help='Step engine: stencil updates the whole board at once, reference updates cell by cell')
+    parser.add_argument('--backend', '-b', choices=list(BACKENDS), default='dense',
+                        help='Board representation: dense keeps an int per cell, packed keeps 64 cells per word, '
+                             'tiled only recomputes tiles that changed, parallel splits the board between processes')
+    parser.add_argument('--tile_size', type=int, default=16, help='Edge of a tile, for the tiled backend')
+    parser.add_argument('--workers', '-w', type=int, default=2, help='Number of worker processes, for the parallel '
+                                                                    'backend')
+    parser.add_argument('--headless', action='store_true', help='Run at full speed without drawing the board')
+    parser.add_argument('--record', default=None, help='Record every generation to this trajectory file, '
+                                                       'which can be played with replay.py')
 
     args = parser.parse_args()
 
-    game = Game(args.board_size, args.begin_alive, args.turns)
+    board_options = {}
+    if args.backend == 'tiled':
+        board_options['tile_size'] = args.tile_size
+    elif args.backend == 'parallel':
+        board_options['workers'] = args.workers
+    game = Game(args.board_size, args.begin_alive, args.turns, args.engine, args.backend, args.headless,
+                args.record, **board_options)
     game.run()
 
+    if args.backend == 'tiled':
+        active_tiles = game.board.active_tiles_history
+        print(f"Active tiles per generation (out of {game.board.num_tiles**2}): {active_tiles}")
+
 
@@ -0,0 +1,37 @@
+import argparse
+
+import matplotlib.pyplot as plt
+import matplotlib.animation as animation
+
+from Trajectory import TrajectoryReader
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Replay a recorded Game of Life trajectory')
+
+    parser.add_argument('trajectory', help='Trajectory file written with main.py --record')
+    parser.add_argument('--start', type=int, default=0, help='First generation to show')
+    parser.add_argument('--stop', type=int, default=None, help='Generation to stop before, defaults to the last one')
+    parser.add_argument('--interval', '-i', type=int, default=500, help='Milliseconds between generations')
+    parser.add_argument('--save', default=None, help='Save the animation to this file instead of showing it')
+
+    args = parser.parse_args()
+
+    with TrajectoryReader(args.trajectory) as reader:
+        stop = len(reader) if args.stop is None else min(args.stop, len(reader))
+        generations = range(args.start, stop)
+
+        fig, ax = plt.subplots()
+        image = ax.imshow(reader.read_frame(args.start), cmap=plt.cm.binary, vmin=0, vmax=1)
+
+        def show_generation(generation):
+            image.set_data(reader.read_frame(generation))
+            ax.set_title(f"Generation {generation}")
+            return image,
+
+        anim = animation.FuncAnimation(fig, show_generation, frames=generations, interval=args.interval,
+                                       repeat=False)
+        if args.save:
+            anim.save(args.save)
+        else:
+            plt.show()
@@ -0,0 +1,204 @@
+import numpy as np
+
+from HIV_model import (ALPHA, UNINFECTED_PRODUCTION, UNINFECTED_DEATH_RATE, LATENT_DEATH_RATE, INFECTED_DEATH_RATE,
+                       VIRION_INFECTION_RATE, VIRUS_DEATH_RATE, TREATMENT_KILL_RATE, UNINFECTED_TO_LATENT_RATE,
+                       TIME_STEP, NUM_STEPS)
+
+import common_path  # puts the shared modules of common/ on the path
+from model_spec import Model
+
+COMPARTMENTS = ("virion", "uninfected", "latent", "infected")
+INITIAL_STATE = {"virion": 10, "uninfected": 500, "latent": 0, "infected": 0}
+
+# Parameters of the model, every one of them can be set separately for every member of a batch.
+# latent_rate is latent_rate_before until day latent_beginning, and latent_rate_after from then on.
+DEFAULT_PARAMETERS = {
+    "alpha": ALPHA,
+    "uninfected_production": UNINFECTED_PRODUCTION,
+    "uninfected_death_rate": UNINFECTED_DEATH_RATE,
+    "latent_death_rate": LATENT_DEATH_RATE,
+    "infected_death_rate": INFECTED_DEATH_RATE,
+    "virion_infection_rate": VIRION_INFECTION_RATE,
+    "virus_death_rate": VIRUS_DEATH_RATE,
+    "treatment_kill_rate": TREATMENT_KILL_RATE,
+    "uninfected_to_latent_rate": UNINFECTED_TO_LATENT_RATE,
+    "latent_rate_before": 0.05,
+    "latent_rate_after": 0.05,
+    "latent_beginning": 2000,
+    "treatment": False,
+}
+
+# The four scenarios of HIV_model.original_model and HIV_model.treatment_model
+SCENARIOS = {
+    "Latent from Beginning": {"latent_rate_before": 0.05, "latent_rate_after": 0.05},
+    "Latent after Equilibrium": {"latent_rate_before": 0, "latent_rate_after": 0.05},
+    "Treatment": {"latent_rate_before": 0, "latent_rate_after": 0.05, "treatment": True},
+    "Treatment and Latent": {"latent_rate_before": 0, "latent_rate_after": 0.5, "treatment": True},
+}
+
+# The rate laws of the model in continuous time, the updates of reference_step divided by the time step, with the
+# latent_rate of the current step as a parameter
+RATE_LAWS = {
+    "virion": "alpha * infected - (virus_death_rate + treatment * treatment_kill_rate) * virion",
+    "uninfected": "uninfected_production - virion_infection_rate * uninfected * virion"
+                  " - uninfected_death_rate * uninfected",
+    "latent": "uninfected_to_latent_rate * virion_infection_rate * uninfected * virion - latent_death_rate * latent"
+              " - latent_rate * latent",
+    "infected": "(1 - uninfected_to_latent_rate) * virion_infection_rate * uninfected * virion + latent_rate * latent"
+                " - infected_death_rate * infected",
+}
+MODEL_PARAMETERS = ("alpha", "uninfected_production", "uninfected_death_rate", "latent_death_rate",
+                    "infected_death_rate", "virion_infection_rate", "virus_death_rate", "treatment_kill_rate",
+                    "uninfected_to_latent_rate", "treatment", "latent_rate")
+MODEL = Model("hiv", COMPARTMENTS, MODEL_PARAMETERS, RATE_LAWS)
+
+ORDERS = ("reference", "fused", "model")
+
+
+def make_parameters(n=None, **overrides):
+    """
+    Create the parameters of a batch of models.
+    :param n: Number of members in the batch, defaults to the length of the longest override
+    :param overrides: Values to use instead of the defaults, scalars or arrays of length n
+    :return: Dictionary of parameter name to an (n,) array
+    """
+    unknown = set(overrides) - set(DEFAULT_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    if n is None:
+        n = max([np.size(value) for value in overrides.values()], default=1)
+
+    parameters = {}
+    for name, default in DEFAULT_PARAMETERS.items():
+        dtype = bool if name == "treatment" else float
+        parameters[name] = np.broadcast_to(np.asarray(overrides.get(name, default), dtype=dtype), (n,)).copy()
+    return parameters
+
+
+def scenario_parameters(names=tuple(SCENARIOS)):
+    """
+    Create the parameters of a batch holding the given scenarios of HIV_model, one member each.
+    :param names: Names of scenarios from SCENARIOS
+    :return: Dictionary of parameter name to an (n,) array
+    """
+    overrides = {name: [] for name in DEFAULT_PARAMETERS}
+    for scenario in names:
+        for name, default in DEFAULT_PARAMETERS.items():
+            overrides[name].append(SCENARIOS[scenario].get(name, default))
+    return make_parameters(len(names), **overrides)
+
+
+def initial_state(parameters, **overrides):
+    """
+    Create the initial state of a batch.
+    :param parameters: Parameters of the batch, as returned by make_parameters
+    :param overrides: Initial values to use instead of INITIAL_STATE, scalars or arrays
+    :return: Dictionary of compartment name to an (n,) array
+    """
+    n = len(parameters["alpha"])
+    return {name: np.broadcast_to(np.asarray(overrides.get(name, INITIAL_STATE[name]), dtype=float), (n,)).copy()
+            for name in COMPARTMENTS}
+
+
+def reference_step(state, parameters, latent_rate, time_step):
+    """
+    Advance the batch by one step, evaluating every update with exactly the operations of the original step by step
+    loop of HIV_model, so the results are equal bit for bit to the runs it made.
+    """
+    virion, uninfected, latent, infected = (state[name] for name in COMPARTMENTS)
+    p = parameters
+    virion_change = p["alpha"] * infected - p["virus_death_rate"] * virion
+    virion_change = np.where(p["treatment"], virion_change - p["treatment_kill_rate"] * virion, virion_change)
+    new_virion = virion + virion_change * time_step
+    new_uninfected = uninfected + (p["uninfected_production"] - uninfected * virion * p["virion_infection_rate"]
+                                   - p["uninfected_death_rate"] * uninfected) * time_step
+    new_latent = latent + (p["uninfected_to_latent_rate"] * uninfected * virion * p["virion_infection_rate"]
+                           - p["latent_death_rate"] * latent - latent_rate * latent) * time_step
+    new_infected = infected + (((1 - p["uninfected_to_latent_rate"]) * uninfected * virion * p["virion_infection_rate"])
+                               + (latent_rate * latent) - (p["infected_death_rate"] * infected)) * time_step
+    return {"virion": new_virion, "uninfected": new_uninfected, "latent": new_latent, "infected": new_infected}
+
+
+def fused_step(state, parameters, latent_rate, time_step):
+    """
+    Advance the batch by one step, computing the infection term once and folding the constant rates together.
+    Faster than reference_step, but rounds differently.
+    """
+    virion, uninfected, latent, infected = (state[name] for name in COMPARTMENTS)
+    p = parameters
+    infection = uninfected * virion * p["virion_infection_rate"]
+    activation = latent_rate * latent
+    return {
+        "virion": virion + (p["alpha"] * infected - p["virion_clearance"] * virion) * time_step,
+        "uninfected": uninfected + (p["uninfected_production"] - infection
+                                    - p["uninfected_death_rate"] * uninfected) * time_step,
+        "latent": latent + (p["uninfected_to_latent_rate"] * infection - p["latent_death_rate"] * latent
+                            - activation) * time_step,
+        "infected": infected + (p["uninfected_to_infected_rate"] * infection + activation
+                                - p["infected_death_rate"] * infected) * time_step,
+    }
+
+
+def model_step(state, parameters, latent_rate, time_step):
+    """Advance the batch by one step, with the right hand side generated from RATE_LAWS by MODEL"""
+    rates = MODEL.rhs(np.array([state[name] for name in COMPARTMENTS]), dict(parameters, latent_rate=latent_rate))
+    return {name: state[name] + rates[k] * time_step for k, name in enumerate(COMPARTMENTS)}
+
+
+STEPS = {"reference": reference_step, "fused": fused_step, "model": model_step}
+
+
+def integrate(parameters, state=None, num_steps=NUM_STEPS, time_step=TIME_STEP, order="reference", record_every=1):
+    """
+    Integrate a batch of models with forward Euler, advancing all members together.
+    :param parameters: Parameters of the batch, as returned by make_parameters
+    :param state: Initial state of the batch, defaults to initial_state(parameters)
+    :param num_steps: Number of time points, including the initial one, as in HIV_model.NUM_STEPS
+    :param time_step: Length of a step in days
+    :param order: "reference" to update exactly as the original loop of HIV_model, "fused" for the faster update, or
+    "model" for the update generated from RATE_LAWS
+    :param record_every: Record the state every that many steps
+    :return: Dictionary with the recorded "time" (t,) and every compartment as an (n, t) array
+    """
+    if order not in ORDERS:
+        raise ValueError(f"Order must be one of {', '.join(ORDERS)}")
+    state = initial_state(parameters) if state is None else {name: np.asarray(state[name], dtype=float)
+                                                             for name in COMPARTMENTS}
+    step = STEPS[order]
+    if order == "fused":
+        parameters = dict(parameters)
+        parameters["virion_clearance"] = (parameters["virus_death_rate"]
+                                          + parameters["treatment"] * parameters["treatment_kill_rate"])
+        parameters["uninfected_to_infected_rate"] = 1 - parameters["uninfected_to_latent_rate"]
+
+    # latent_rate switches at the first step that is not before latent_beginning, as in HIV_model
+    latent_beginning = parameters["latent_beginning"] / time_step
+    recorded_steps = np.arange(0, num_steps, record_every)
+    trajectory = {name: np.empty((len(state["virion"]), len(recorded_steps))) for name in COMPARTMENTS}
+    for name in COMPARTMENTS:
+        trajectory[name][:, 0] = state[name]
+
+    for j in range(1, num_steps):
+        latent_rate = np.where(j < latent_beginning, parameters["latent_rate_before"], parameters["latent_rate_after"])
+        state = step(state, parameters, latent_rate, time_step)
+        if j % record_every == 0:
+            for name in COMPARTMENTS:
+                trajectory[name][:, j // record_every] = state[name]
+
+    trajectory["time"] = recorded_steps * time_step
+    return trajectory
+
+
+def sweep(num_steps=NUM_STEPS, time_step=TIME_STEP, order="fused", record_every=None, **ranges):
+    """
+    Integrate the model over the full grid of the given parameter values.
+    :param ranges: Parameter name to the values it takes in the sweep
+    :param record_every: Record the state every that many steps, defaults to recording only the final state
+    :return: The parameters of every member of the grid, and the trajectory of the batch
+    """
+    names = list(ranges)
+    grid = np.meshgrid(*[np.asarray(ranges[name]) for name in names], indexing="ij")
+    parameters = make_parameters(**{name: values.ravel() for name, values in zip(names, grid)})
+    record_every = max(num_steps - 1, 1) if record_every is None else record_every
+    return parameters, integrate(parameters, num_steps=num_steps, time_step=time_step, order=order,
+                                 record_every=record_every)
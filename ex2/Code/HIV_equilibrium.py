@@ -0,0 +1,221 @@
+import numpy as np
+
+from HIV_model import TIME_STEP, NUM_STEPS
+from HIV_batch import COMPARTMENTS, SCENARIOS, scenario_parameters, initial_state, fused_step
+from HIV_ode import derivatives, jacobian
+
+NEWTON_ITERATIONS = 50
+NEWTON_TOLERANCE = 1e-10
+# relative distance from a stable equilibrium at which a member counts as converged
+CONVERGENCE_TOLERANCE = 1e-5
+CHECK_EVERY = 100
+
+
+def analytic_seeds(parameters, latent_rate):
+    """
+    Starting points for Newton's method: the infection free state, and the endemic state found by solving the
+    steady state equations by hand (it is only positive when the infection can persist).
+    :param parameters: Parameters of a batch, as returned by HIV_batch.make_parameters
+    :param latent_rate: Rate of activation of latent cells, scalar or (n,)
+    :return: List of states, each (4, n)
+    """
+    p = parameters
+    production, death = p["uninfected_production"], p["uninfected_death_rate"]
+    rate, to_latent = p["virion_infection_rate"], p["uninfected_to_latent_rate"]
+    clearance = p["virus_death_rate"] + p["treatment"] * p["treatment_kill_rate"]
+    zero = np.zeros_like(production)
+    infection_free = np.array([zero, production / death, zero, zero])
+
+    # at the endemic state, every infection ends up producing infected cells at this share
+    to_infected = (1 - to_latent) + to_latent * latent_rate / (p["latent_death_rate"] + latent_rate)
+    uninfected = p["infected_death_rate"] * clearance / (p["alpha"] * rate * to_infected)
+    virion = (production - death * uninfected) / (rate * uninfected)
+    latent = to_latent * rate * uninfected * virion / (p["latent_death_rate"] + latent_rate)
+    infected = clearance * virion / p["alpha"]
+    endemic = np.array([virion, uninfected, latent, infected + zero])
+    return [infection_free, endemic]
+
+
+def newton(y, parameters, latent_rate, iterations=NEWTON_ITERATIONS, tolerance=NEWTON_TOLERANCE):
+    """
+    Solve derivatives(y) = 0 with Newton's method, for all members of a batch at once.
+    :param y: Starting points, (4, n)
+    :return: The roots, (4, n), and whether every member converged, (n,)
+    """
+    y = np.array(y, dtype=float)
+    converged = np.zeros(y.shape[1], dtype=bool)
+    for _ in range(iterations):
+        residual = derivatives(y, parameters, latent_rate)
+        jac = np.moveaxis(jacobian(y, parameters, latent_rate), -1, 0)
+        with np.errstate(all="ignore"):
+            delta = np.linalg.solve(jac, -residual.T[..., None])[..., 0].T
+        delta[:, converged] = 0
+        y += delta
+        converged |= np.all(np.abs(delta) <= tolerance * (1 + np.abs(y)), axis=0)
+        if np.all(converged):
+            break
+    return y, converged & np.all(np.isfinite(y), axis=0)
+
+
+def stability(y, parameters, latent_rate):
+    """
+    The eigenvalues of the jacobian at the given states, and whether the states are stable.
+    :param y: States, (4, n)
+    :return: Eigenvalues, (n, 4), and stability, (n,)
+    """
+    eigenvalues = np.linalg.eigvals(np.moveaxis(jacobian(y, parameters, latent_rate), -1, 0))
+    return eigenvalues, np.all(eigenvalues.real < 0, axis=1)
+
+
+def find_equilibria(parameters, latent_rate, seeds=None):
+    """
+    Find the fixed points of the model for every member of a batch, with their stability.
+    :param parameters: Parameters of a batch, as returned by HIV_batch.make_parameters
+    :param latent_rate: Rate of activation of latent cells, scalar or (n,)
+    :param seeds: Starting points, list of (4, n) states, defaults to analytic_seeds
+    :return: List with a dictionary per seed, holding the "state" (4, n) it converged to, whether it "converged",
+    is "physical" (non-negative), is "stable", and the "eigenvalues" (n, 4)
+    """
+    seeds = analytic_seeds(parameters, latent_rate) if seeds is None else seeds
+    equilibria = []
+    for seed in seeds:
+        state, converged = newton(seed, parameters, latent_rate)
+        eigenvalues, stable = stability(np.nan_to_num(state), parameters, latent_rate)
+        physical = np.all(state >= -NEWTON_TOLERANCE * (1 + np.abs(state)), axis=0)
+        equilibria.append({"state": state, "converged": converged, "physical": converged & physical,
+                           "stable": converged & physical & stable, "eigenvalues": eigenvalues})
+    return equilibria
+
+
+def stable_equilibrium(parameters, latent_rate, state):
+    """
+    The stable fixed point every member of a batch is converging to, if it has one, searched by Newton's method from
+    its current state and from the analytic seeds.
+    :param state: Current state of the batch, (4, n)
+    :return: The fixed points, (4, n), and whether a stable one was found, (n,)
+    """
+    equilibrium = np.full(state.shape, np.nan)
+    found = np.zeros(state.shape[1], dtype=bool)
+    for candidate in find_equilibria(parameters, latent_rate, [state] + analytic_seeds(parameters, latent_rate)):
+        new = candidate["stable"] & ~found
+        equilibrium[:, new] = candidate["state"][:, new]
+        found |= new
+    return equilibrium, found
+
+
+def integrate_with_skip(parameters, state=None, num_steps=NUM_STEPS, time_step=TIME_STEP, record_every=1,
+                        tolerance=CONVERGENCE_TOLERANCE, check_every=CHECK_EVERY):
+    """
+    Integrate a batch with the fused forward Euler step of HIV_batch, but every check_every steps freeze the members
+    that are within tolerance of the stable fixed point of their current latent rate, until their next scheduled
+    event, the latent beginning. The fixed points are found once, before and after the latent beginning. A fixed
+    point of the equations is also a fixed point of the Euler step, so a frozen member stays where Euler would have
+    kept it. The steps are run in blocks that end at a check or an event, inside which the latent rates and the set of
+    running members are constant, so only the running members are stepped, with no bookkeeping per step, and once all
+    of them are frozen the integration skips ahead to the next event.
+    Pays off most when many members settle long before the end, as in large sweeps: with 10000 members it takes about
+    a quarter of the time of HIV_batch.integrate with the fused order, and for the four scenarios about three quarters.
+    :return: The trajectory, as returned by HIV_batch.integrate, with the number of "member_steps_computed" and
+    "member_steps_skipped"
+    """
+    state = initial_state(parameters) if state is None else {name: np.array(state[name], dtype=float)
+                                                             for name in COMPARTMENTS}
+    parameters = dict(parameters)
+    parameters["virion_clearance"] = (parameters["virus_death_rate"]
+                                      + parameters["treatment"] * parameters["treatment_kill_rate"])
+    parameters["uninfected_to_infected_rate"] = 1 - parameters["uninfected_to_latent_rate"]
+    # first step of every member that uses latent_rate_after
+    event_step = np.maximum(np.ceil(parameters["latent_beginning"] / time_step), 1)
+    events = np.unique(event_step)
+
+    n = len(parameters["alpha"])
+    recorded_steps = np.arange(0, num_steps, record_every)
+    trajectory = {name: np.empty((n, len(recorded_steps))) for name in COMPARTMENTS}
+    for name in COMPARTMENTS:
+        trajectory[name][:, 0] = state[name]
+    # stable fixed point of every member, before and after the latent beginning
+    y0 = np.array([state[name] for name in COMPARTMENTS])
+    before, found_before = stable_equilibrium(parameters, parameters["latent_rate_before"], y0)
+    after, found_after = stable_equilibrium(parameters, parameters["latent_rate_after"], y0)
+
+    frozen = np.zeros(n, dtype=bool)
+    # the running members are stepped in their own compact arrays, which are only gathered from and scattered back
+    # to the full state when the set of frozen members changes, or the state is recorded
+    running = np.arange(n)
+    running_parameters, running_state = parameters, {name: state[name].copy() for name in COMPARTMENTS}
+    member_steps_computed = 0
+
+    j = 1
+    while j < num_steps:
+        frozen &= event_step != j
+        if len(running) != n - np.sum(frozen):
+            for name in COMPARTMENTS:
+                state[name][running] = running_state[name]
+            running = np.flatnonzero(~frozen)
+            running_parameters = {name: values[running] for name, values in parameters.items()}
+            running_state = {name: state[name][running] for name in COMPARTMENTS}
+        upcoming = events[events > j]
+        next_event = int(min(upcoming[0], num_steps)) if len(upcoming) else num_steps
+
+        if len(running) == 0:
+            # nothing changes until the next event, fill the recorded steps up to it with the frozen state
+            records = slice(-(-j // record_every), -(-next_event // record_every))
+            for name in COMPARTMENTS:
+                trajectory[name][:, records] = state[name][:, None]
+            j = next_event
+            continue
+
+        # the block ends after the next check, or before the next event
+        check = -(-j // check_every) * check_every
+        stop = min(next_event, check + 1)
+        is_after = j >= event_step[running]
+        latent_rate = np.where(is_after, running_parameters["latent_rate_after"],
+                               running_parameters["latent_rate_before"])
+        for k in range(j, stop):
+            running_state = fused_step(running_state, running_parameters, latent_rate, time_step)
+            if k % record_every == 0:
+                for name in COMPARTMENTS:
+                    state[name][running] = running_state[name]
+                    trajectory[name][:, k // record_every] = state[name]
+        member_steps_computed += len(running) * (stop - j)
+        j = stop
+
+        if stop == check + 1:
+            y = np.array([running_state[name] for name in COMPARTMENTS])
+            equilibrium = np.where(is_after, after[:, running], before[:, running])
+            found = np.where(is_after, found_after[running], found_before[running])
+            with np.errstate(invalid="ignore"):
+                close = found & np.all(np.abs(y - equilibrium) <= tolerance * (1 + np.abs(equilibrium)), axis=0)
+            for k, name in enumerate(COMPARTMENTS):
+                running_state[name] = np.where(close, equilibrium[k], running_state[name])
+            frozen[running[close]] = True
+            if np.any(close) and check % record_every == 0:
+                # the check came after the step was recorded, record the members it moved to their fixed points
+                for name in COMPARTMENTS:
+                    state[name][running] = running_state[name]
+                    trajectory[name][:, check // record_every] = state[name]
+
+    for name in COMPARTMENTS:
+        state[name][running] = running_state[name]
+    trajectory["time"] = recorded_steps * time_step
+    trajectory["member_steps_computed"] = member_steps_computed
+    trajectory["member_steps_skipped"] = n * (num_steps - 1) - member_steps_computed
+    return trajectory
+
+
+if __name__ == '__main__':
+    parameters = scenario_parameters()
+    for period, rate in (("before", "latent_rate_before"), ("after", "latent_rate_after")):
+        for equilibrium in find_equilibria(parameters, parameters[rate]):
+            for k, scenario in enumerate(SCENARIOS):
+                if not equilibrium["physical"][k]:
+                    continue
+                values = ", ".join(f"{name} {value:.4g}" for name, value in zip(COMPARTMENTS,
+                                                                                equilibrium["state"][:, k]))
+                kind = "stable" if equilibrium["stable"][k] else "unstable"
+                print(f"{scenario}, {period} latent beginning: {kind} equilibrium at {values}, "
+                      f"largest eigenvalue real part {np.max(equilibrium['eigenvalues'][k].real):.3g}")
+
+    trajectory = integrate_with_skip(parameters, record_every=NUM_STEPS - 1)
+    print(f"Integration with skipping: {trajectory['member_steps_computed']} member steps computed, "
+          f"{trajectory['member_steps_skipped']} skipped")
@@ -1,6 +1,10 @@
 import numpy as np
 import matplotlib.pyplot as plt
-from plotly import graph_objects as go
+
+from HIV_store import POINT_BUDGET, save_run, is_stored, plot_run
+
+import common_path  # puts the shared modules of common/ on the path
+from render import Renderer
 
 # Global variables
 ALPHA = 100
@@ -20,63 +24,54 @@ TIME_STEP = 0.05  # days
 NUM_STEPS = int(RUN_TIME / TIME_STEP)
 LATENT_BEGINNING = 2000 / TIME_STEP
 
-def delta_u(uninfected, virion):
-    return ((UNINFECTED_PRODUCTION - uninfected * virion * VIRION_INFECTION_RATE - UNINFECTED_DEATH_RATE * uninfected) *
-            TIME_STEP)
-
+# update of the batch engine the scenarios are integrated with, "reference" is bit for bit the original loop, see
+# HIV_batch.ORDERS
+ORDER = "reference"
 
-def delta_i(uninfected, virion, latent, infected, latent_rate=0.05):
-    return ((UNINFECTED_TO_INFECTED_RATE * uninfected * virion * VIRION_INFECTION_RATE) + (latent_rate * latent)
-            - (INFECTED_DEATH_RATE * infected)) * TIME_STEP
 
+def run_scenario(scenario, virion, uninfected, latent, infected, order=ORDER):
+    # Integrate a scenario of HIV_batch.SCENARIOS from the first values of the arrays, and fill them with the run.
+    # HIV_batch is imported here, as it imports the constants of this module
+    from HIV_batch import scenario_parameters, integrate
+    initial = {"virion": virion[:1], "uninfected": uninfected[:1], "latent": latent[:1], "infected": infected[:1]}
+    trajectory = integrate(scenario_parameters([scenario]), initial, NUM_STEPS, TIME_STEP, order)
+    for array, name in ((virion, "virion"), (uninfected, "uninfected"), (latent, "latent"), (infected, "infected")):
+        array[:] = trajectory[name][0]
 
-def delta_v(virion, infected, treatment=False):
-    if not treatment:
-        return (ALPHA * infected - VIRUS_DEATH_RATE * virion) * TIME_STEP
-    else:
-        return (ALPHA * infected - VIRUS_DEATH_RATE * virion - TREATMENT_KILL_RATE * virion) * TIME_STEP
 
+def run_metadata(latent_rate_before, latent_rate_after, treatment, order=ORDER):
+    # Everything the run depends on, a stored run with the same metadata is reused instead of simulated again
+    return {"alpha": ALPHA, "uninfected_production": UNINFECTED_PRODUCTION,
+            "uninfected_death_rate": UNINFECTED_DEATH_RATE, "latent_death_rate": LATENT_DEATH_RATE,
+            "infected_death_rate": INFECTED_DEATH_RATE, "virion_infection_rate": VIRION_INFECTION_RATE,
+            "virus_death_rate": VIRUS_DEATH_RATE, "treatment_kill_rate": TREATMENT_KILL_RATE,
+            "uninfected_to_latent_rate": UNINFECTED_TO_LATENT_RATE, "run_time": RUN_TIME, "time_step": TIME_STEP,
+            "latent_beginning": LATENT_BEGINNING * TIME_STEP, "latent_rate_before": latent_rate_before,
+            "latent_rate_after": latent_rate_after, "treatment": treatment, "order": order}
 
-def delta_l(uninfected, virion, latent, latent_rate=0.05):
-    return (UNINFECTED_TO_LATENT_RATE * uninfected * virion * VIRION_INFECTION_RATE - LATENT_DEATH_RATE * latent -
-            latent_rate * latent) * TIME_STEP
 
+def save_model(name, metadata, virion, uninfected, latent, infected):
+    save_run(name, np.arange(NUM_STEPS) * TIME_STEP,
+             {"virion": virion, "uninfected": uninfected, "latent": latent, "infected": infected}, metadata)
 
-def run_step(virion, uninfected, latent, infected, latent_rate, i, treatment):
-    virion[i] = virion[i - 1] + delta_v(virion[i - 1], infected[i - 1], treatment)
-    uninfected[i] = uninfected[i - 1] + delta_u(uninfected[i - 1], virion[i - 1])
-    latent[i] = latent[i - 1] + delta_l(uninfected[i - 1], virion[i - 1], latent[i - 1],  latent_rate)
-    infected[i] = infected[i - 1] + delta_i(uninfected[i - 1], virion[i - 1], latent[i - 1], infected[i - 1],
-                                            latent_rate)
 
-
-def original_model(virion, uninfected, latent, infected):
+def original_model(virion, uninfected, latent, infected, point_budget=POINT_BUDGET, renderer=None, order=ORDER):
+    renderer = Renderer(workers=0) if renderer is None else renderer
     # Run twice, once with latent to infected from begging, and once with latent to infected after reaching equilibrium
     for i in range(2):
-        for j in range(1, NUM_STEPS):
-            if i == 0:  # If latent to infected starts from beginning
-                latent_rate = 0.05
-                run_step(virion, uninfected, latent, infected, latent_rate, j, False)
-            else:  # If latent outbreaks only after reaching equilibrium
-                if j < LATENT_BEGINNING:
-                    latent_rate = 0
-                    run_step(virion, uninfected, latent, infected, latent_rate, j, False)
-                else:
-                    latent_rate = 0.05
-                    run_step(virion, uninfected, latent, infected, latent_rate, j, False)
-
-        # Plot all the equations on same graph with plotly
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(x=np.arange(0, RUN_TIME, TIME_STEP), y=virion, name="Virion"))
-        fig.add_trace(go.Scatter(x=np.arange(0, RUN_TIME, TIME_STEP), y=uninfected, name="Uninfected"))
-        fig.add_trace(go.Scatter(x=np.arange(0, RUN_TIME, TIME_STEP), y=latent, name="Latent"))
-        fig.add_trace(go.Scatter(x=np.arange(0, RUN_TIME, TIME_STEP), y=infected, name="Infected"))
+        scenario = "Latent from Beginning" if i == 0 else "Latent after Equilibrium"
+        name = f"HIV Model {scenario}"
+        metadata = run_metadata(0.05 if i == 0 else 0, 0.05, False, order)
+        if not is_stored(name, metadata):
+            run_scenario(scenario, virion, uninfected, latent, infected, order)
+            save_model(name, metadata, virion, uninfected, latent, infected)
+
+        # Plot all the equations on same graph with plotly, downsampled from the store
         if i == 0:  # If latent to infected starts from beginning
-            fig.update_layout(title="HIV model with latent to infected from beginning", xaxis_title="Time (days)",
-                              yaxis_title="Number of cells")
-            fig.write_html(f"../Figs/HIV Model Latent from Beginning.html", full_html=False, include_plotlyjs='cdn')
-
+            fig = plot_run(name, "HIV model with latent to infected from beginning", point_budget=point_budget)
         else:  # If latent outbreaks only after reaching equilibrium
+            fig = plot_run(name, "HIV model with latent to infected after reaching equilibrium",
+                           point_budget=point_budget)
             # Add vertical line to show when latent to infected starts
             fig.add_shape(
                 dict(
@@ -99,47 +94,29 @@ def original_model(virion, uninfected, latent, infected):
                     font=dict(color='black')
                 )
             )
-            fig.update_layout(title="HIV model with latent to infected after reaching equilibrium",
-                              xaxis_title="Time (days)",
-                              yaxis_title="Number of cells")
-            fig.write_html(f"../Figs/HIV Model Latent after Equilibrium.html", full_html=False, include_plotlyjs='cdn')
-
-        fig.show()
+        renderer.save(fig, f"../Figs/{name}.html", full_html=False, include_plotlyjs='cdn')
+        renderer.show(fig)
 
 
-def treatment_model(virion, uninfected, latent, infected):
+def treatment_model(virion, uninfected, latent, infected, point_budget=POINT_BUDGET, renderer=None, order=ORDER):
+    renderer = Renderer(workers=0) if renderer is None else renderer
     # Run twice, once with just treatment, and once with treatment and higher latent to infected rate
     for i in range(2):
-        for j in range(1, NUM_STEPS):
-            if i == 0:  # If just treatment
-                if j < LATENT_BEGINNING:
-                    latent_rate = 0
-                else:
-                    latent_rate = 0.05
-                run_step(virion, uninfected, latent, infected, latent_rate, j, True)
-            else:  # If treatment and higher latent to infected rate
-                if j < LATENT_BEGINNING:
-                    latent_rate = 0
-                else:
-                    latent_rate = 0.5
-                run_step(virion, uninfected, latent, infected, latent_rate, j, True)
-
-        # Plot all the equations on same graph with plotly
-        fig = go.Figure()
-        fig.add_trace(go.Scatter(x=np.arange(0, RUN_TIME, TIME_STEP), y=virion, name="Virion"))
-        fig.add_trace(go.Scatter(x=np.arange(0, RUN_TIME, TIME_STEP), y=uninfected, name="Uninfected"))
-        fig.add_trace(go.Scatter(x=np.arange(0, RUN_TIME, TIME_STEP), y=latent, name="Latent"))
-        fig.add_trace(go.Scatter(x=np.arange(0, RUN_TIME, TIME_STEP), y=infected, name="Infected"))
+        scenario = "Treatment" if i == 0 else "Treatment and Latent"
+        name = f"HIV Model {scenario}"
+        metadata = run_metadata(0, 0.05 if i == 0 else 0.5, True, order)
+        if not is_stored(name, metadata):
+            run_scenario(scenario, virion, uninfected, latent, infected, order)
+            save_model(name, metadata, virion, uninfected, latent, infected)
+
+        # Plot all the equations on same graph with plotly, downsampled from the store
         if i == 0:
-            fig.update_layout(title="HIV model with treatment", xaxis_title="Time (days)",
-                              yaxis_title="Number of cells")
-            fig.write_html(f"../Figs/HIV Model Treatment.html", full_html=False, include_plotlyjs='cdn')
+            fig = plot_run(name, "HIV model with treatment", point_budget=point_budget)
         else:
-            fig.update_layout(title="HIV model with treatment and higher latent to infected rate",
-                              xaxis_title="Time (days)",
-                              yaxis_title="Number of cells")
-            fig.write_html(f"../Figs/HIV Model Treatment and Latent.html", full_html=False, include_plotlyjs='cdn')
-        fig.show()
+            fig = plot_run(name, "HIV model with treatment and higher latent to infected rate",
+                           point_budget=point_budget)
+        renderer.save(fig, f"../Figs/{name}.html", full_html=False, include_plotlyjs='cdn')
+        renderer.show(fig)
 
 
 def init_arrays():
@@ -155,8 +132,10 @@ def init_arrays():
 
 
 if __name__ == '__main__':
-    virion, uninfected, latent, infected = init_arrays()
-    original_model(virion, uninfected, latent, infected)
+    # the figures are written by the workers of the renderer while the next model runs
+    with Renderer() as renderer:
+        virion, uninfected, latent, infected = init_arrays()
+        original_model(virion, uninfected, latent, infected, renderer=renderer)
 
-    virion, uninfected, latent, infected = init_arrays()
-    treatment_model(virion, uninfected, latent, infected)
+        virion, uninfected, latent, infected = init_arrays()
+        treatment_model(virion, uninfected, latent, infected, renderer=renderer)
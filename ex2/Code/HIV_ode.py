@@ -0,0 +1,161 @@
+import numpy as np
+from scipy.integrate import solve_ivp
+
+from HIV_model import RUN_TIME, TIME_STEP, NUM_STEPS
+from HIV_batch import MODEL, COMPARTMENTS, SCENARIOS, scenario_parameters, initial_state, integrate
+
+METHODS = ("RK45", "DOP853", "LSODA", "Radau", "BDF")
+# methods that use the jacobian
+IMPLICIT_METHODS = ("LSODA", "Radau", "BDF")
+# Under treatment the virions and infected cells fall by more than 15 orders of magnitude before the infection
+# rebounds, and when it rebounds depends on how accurately those tiny values are followed. So the absolute tolerance
+# of every compartment is rtol times this fraction of its size, which keeps the error control relative all the way down
+ABSOLUTE_TOLERANCE_FRACTION = 1e-18
+# the solver and tolerance of the reference solution the other solvers and Euler are measured against
+REFERENCE_METHOD = "DOP853"
+REFERENCE_RTOL = 1e-12
+
+
+def member_parameters(parameters, member=0):
+    """
+    Take the parameters of one member out of a batch.
+    :param parameters: Parameters of a batch, as returned by HIV_batch.make_parameters
+    :param member: Index of the member in the batch
+    :return: Dictionary of parameter name to a scalar
+    """
+    return {name: values[member] for name, values in parameters.items()}
+
+
+def derivatives(y, parameters, latent_rate):
+    """
+    The right hand side of the model in continuous time, HIV_batch.RATE_LAWS.
+    :param y: State, with the compartments in the order of COMPARTMENTS along the first axis, (4,) or (4, n)
+    :param parameters: Parameters, scalars or arrays that broadcast against y[0]
+    :param latent_rate: Rate of activation of latent cells
+    :return: Derivatives in the shape of y
+    """
+    return MODEL.rhs(y, dict(parameters, latent_rate=latent_rate))
+
+
+def jacobian(y, parameters, latent_rate):
+    """
+    The exact jacobian of derivatives with respect to the state, generated from the rate laws of HIV_batch.MODEL.
+    :param y: State, (4,) or (4, n)
+    :param parameters: Parameters, scalars or arrays that broadcast against y[0]
+    :param latent_rate: Rate of activation of latent cells
+    :return: Jacobian, (4, 4) or (4, 4, n), where [i, j] is the derivative of compartment i by compartment j
+    """
+    return MODEL.jacobian(y, dict(parameters, latent_rate=latent_rate))
+
+
+def segments(parameters, run_time=RUN_TIME):
+    """
+    Split the run at the latent beginning, where latent_rate jumps, so it is integrated as a discontinuity event
+    rather than stepped over.
+    :return: List of (start, end, latent_rate) tuples
+    """
+    switch = parameters["latent_beginning"]
+    if parameters["latent_rate_before"] == parameters["latent_rate_after"] or not 0 < switch < run_time:
+        rate = parameters["latent_rate_before"] if switch >= run_time else parameters["latent_rate_after"]
+        return [(0, run_time, rate)]
+    return [(0, switch, parameters["latent_rate_before"]), (switch, run_time, parameters["latent_rate_after"])]
+
+
+def solve(parameters, y0=None, run_time=RUN_TIME, method="LSODA", rtol=1e-6, atol=None, t_eval=None):
+    """
+    Integrate one member of the model with an adaptive solver from scipy, restarting it at the latent beginning.
+    :param parameters: Parameters of one member, as returned by member_parameters
+    :param y0: Initial state in the order of COMPARTMENTS, defaults to HIV_batch.INITIAL_STATE
+    :param method: Solver, one of METHODS. The implicit ones get the analytic jacobian
+    :param atol: Absolute tolerance, scalar or (4,), defaults to rtol * ABSOLUTE_TOLERANCE_FRACTION of the size of every
+    compartment, its initial value but at least 1
+    :param t_eval: Times to return the solution at, defaults to the steps the solver took
+    :return: Dictionary with "time", every compartment, and "stats" with the work the solver did
+    """
+    if method not in METHODS:
+        raise ValueError(f"Method must be one of {', '.join(METHODS)}")
+    if y0 is None:
+        state = initial_state({"alpha": np.zeros(1)})
+        y0 = np.array([state[name][0] for name in COMPARTMENTS])
+
+    if atol is None:
+        atol = rtol * ABSOLUTE_TOLERANCE_FRACTION * np.maximum(np.abs(np.asarray(y0, dtype=float)), 1)
+
+    times, values = [], []
+    stats = {"nfev": 0, "njev": 0, "nlu": 0, "steps": 0}
+    y = np.asarray(y0, dtype=float)
+    for start, end, latent_rate in segments(parameters, run_time):
+        options = {"jac": lambda t, y, rate=latent_rate: jacobian(y, parameters, rate)} \
+            if method in IMPLICIT_METHODS else {}
+        solution = solve_ivp(lambda t, y, rate=latent_rate: derivatives(y, parameters, rate), (start, end), y,
+                             method=method, rtol=rtol, atol=atol, dense_output=t_eval is not None, **options)
+        if not solution.success or not np.all(np.isfinite(solution.y)):
+            raise RuntimeError(f"Solver failed between days {start} and {end}: {solution.message}")
+        stats["nfev"] += solution.nfev
+        stats["njev"] += solution.njev
+        stats["nlu"] += solution.nlu
+        stats["steps"] += len(solution.t) - 1
+
+        if t_eval is None:
+            times.append(solution.t)
+            values.append(solution.y)
+        else:
+            # every time belongs to the segment it starts, the last segment also takes the end of the run
+            in_segment = (t_eval >= start) & ((t_eval < end) | ((end == run_time) & (t_eval <= end)))
+            times.append(t_eval[in_segment])
+            values.append(solution.sol(t_eval[in_segment]).reshape(4, -1))
+        y = solution.y[:, -1]
+
+    result = {"time": np.concatenate(times), "stats": stats}
+    for k, name in enumerate(COMPARTMENTS):
+        result[name] = np.concatenate([value[k] for value in values])
+    return result
+
+
+def relative_error(values, reference):
+    """The largest difference from the reference, relative to the largest value of the reference"""
+    return np.max(np.abs(values - reference)) / np.max(np.abs(reference))
+
+
+def reference_solution(parameters, t_eval):
+    """The solution of one member with REFERENCE_METHOD at REFERENCE_RTOL, at the given times"""
+    return solve(parameters, method=REFERENCE_METHOD, rtol=REFERENCE_RTOL, t_eval=t_eval)
+
+
+def compare(scenario, method="LSODA", rtol=1e-6, atol=None, reference=None):
+    """
+    Run a scenario of HIV_model with an adaptive solver, and measure its error against the reference solution, at
+    the steps of the forward Euler run of HIV_model.
+    :param scenario: Name of a scenario from HIV_batch.SCENARIOS
+    :param reference: The reference_solution of the scenario at the Euler steps, if it was already computed
+    :return: Dictionary with the work of the solver, how many times fewer RHS evaluations it made than Euler, and for
+    every compartment its largest error, relative to the largest value of the compartment
+    """
+    parameters = member_parameters(scenario_parameters([scenario]))
+    times = np.arange(NUM_STEPS) * TIME_STEP
+    reference = reference_solution(parameters, times) if reference is None else reference
+    adaptive = solve(parameters, method=method, rtol=rtol, atol=atol, t_eval=times)
+    report = dict(adaptive["stats"])
+    report["speedup"] = (NUM_STEPS - 1) / report["nfev"]
+    for name in COMPARTMENTS:
+        report[f"{name}_error"] = relative_error(adaptive[name], reference[name])
+    return report
+
+
+if __name__ == '__main__':
+    for scenario in SCENARIOS:
+        reference = reference_solution(member_parameters(scenario_parameters([scenario])),
+                                       np.arange(NUM_STEPS) * TIME_STEP)
+        euler = integrate(scenario_parameters([scenario]))
+        errors = ", ".join(f"{name} {relative_error(euler[name][0], reference[name]):.1e}" for name in COMPARTMENTS)
+        print(f"{scenario}, Euler: {NUM_STEPS - 1} RHS evaluations. Relative error against {REFERENCE_METHOD} at "
+              f"rtol {REFERENCE_RTOL:g} ({reference['stats']['nfev']} RHS evaluations): {errors}")
+        for method in ("RK45", "LSODA", "Radau", "BDF"):
+            try:
+                report = compare(scenario, method, reference=reference)
+            except RuntimeError as error:
+                print(f"{scenario}, {method}: {error}")
+                continue
+            errors = ", ".join(f"{name} {report[f'{name}_error']:.1e}" for name in COMPARTMENTS)
+            print(f"{scenario}, {method}: {report['steps']} steps, {report['nfev']} RHS evaluations "
+                  f"({report['speedup']:.0f}x fewer than Euler), {report['njev']} jacobians. Relative error: {errors}")
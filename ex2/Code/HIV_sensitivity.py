@@ -0,0 +1,188 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+from scipy.stats import qmc
+
+from HIV_model import TIME_STEP, NUM_STEPS
+from HIV_batch import MODEL, MODEL_PARAMETERS, COMPARTMENTS, scenario_parameters, initial_state, integrate
+from HIV_ode import derivatives, jacobian
+
+# parameters the sensitivities are computed for, the latent rate before and after the latent beginning separately
+SENSITIVITY_PARAMETERS = ("alpha", "uninfected_production", "uninfected_death_rate", "latent_death_rate",
+                          "infected_death_rate", "virion_infection_rate", "virus_death_rate", "treatment_kill_rate",
+                          "uninfected_to_latent_rate", "latent_rate_before", "latent_rate_after")
+OUTPUTS = ("virion", "latent")
+# every parameter of a Sobol analysis varies uniformly between (1 - SPREAD) and (1 + SPREAD) of its base value
+SPREAD = 0.5
+SOBOL_SAMPLES = 1024
+CHUNK_SIZE = 512
+
+
+def parameter_derivatives(y, parameters, latent_rate, after, names=SENSITIVITY_PARAMETERS):
+    """
+    The derivatives of the right hand side of HIV_ode.derivatives with respect to the parameters, generated from the
+    rate laws of HIV_batch.MODEL. The latent rate is latent_rate_before until the latent beginning and
+    latent_rate_after from then on, so each of them gets the derivative by the latent rate while it is in use.
+    :param y: State, (4, n)
+    :param latent_rate: Rate of activation of latent cells, (n,)
+    :param after: Whether every member is past its latent beginning, (n,)
+    :return: Derivatives, (4, len(names), n), where [i, k] is the derivative of compartment i by parameter k
+    """
+    columns = dict(zip(MODEL_PARAMETERS, MODEL.parameter_jacobian(y, dict(parameters, latent_rate=latent_rate))
+                       .transpose(1, 0, 2)))
+    columns["latent_rate_before"] = columns["latent_rate"] * ~after
+    columns["latent_rate_after"] = columns["latent_rate"] * after
+    return np.array([columns[name] for name in names]).transpose(1, 0, 2)
+
+
+def forward_sensitivities(parameters, names=SENSITIVITY_PARAMETERS, num_steps=NUM_STEPS, time_step=TIME_STEP,
+                          record_every=100):
+    """
+    Integrate a batch together with its variational equations, dS/dt = J S + df/dp, with the forward Euler step of
+    HIV_batch. The sensitivities are the exact derivatives of the Euler trajectory by the parameters.
+    :param parameters: Parameters of the batch, as returned by HIV_batch.make_parameters
+    :param names: Parameters to differentiate by, from SENSITIVITY_PARAMETERS
+    :return: Dictionary with the recorded "time" (t,), every compartment as an (n, t) array, and the "sensitivities"
+    of every compartment by every parameter, (4, len(names), n, t)
+    """
+    state = initial_state(parameters)
+    y = np.array([state[name] for name in COMPARTMENTS])
+    s = np.zeros((4, len(names), y.shape[1]))
+    latent_beginning = parameters["latent_beginning"] / time_step
+
+    recorded_steps = np.arange(0, num_steps, record_every)
+    trajectory = {name: np.empty((y.shape[1], len(recorded_steps))) for name in COMPARTMENTS}
+    sensitivities = np.zeros(s.shape + (len(recorded_steps),))
+    for k, name in enumerate(COMPARTMENTS):
+        trajectory[name][:, 0] = y[k]
+
+    for j in range(1, num_steps):
+        # the step from j - 1 to j uses the latent rate of step j, as in HIV_batch.integrate
+        after = j >= latent_beginning
+        latent_rate = np.where(after, parameters["latent_rate_after"], parameters["latent_rate_before"])
+        s = s + (np.einsum("ijn,jkn->ikn", jacobian(y, parameters, latent_rate), s)
+                 + parameter_derivatives(y, parameters, latent_rate, after, names)) * time_step
+        y = y + derivatives(y, parameters, latent_rate) * time_step
+        if j % record_every == 0:
+            for k, name in enumerate(COMPARTMENTS):
+                trajectory[name][:, j // record_every] = y[k]
+            sensitivities[..., j // record_every] = s
+
+    trajectory["time"] = recorded_steps * time_step
+    trajectory["sensitivities"] = sensitivities
+    return trajectory
+
+
+def normalized_sensitivities(parameters, names=SENSITIVITY_PARAMETERS, outputs=OUTPUTS, **options):
+    """
+    The relative change of the final value of every output by a relative change of every parameter,
+    p / y * dy / dp, for every member of a batch.
+    :return: Dictionary of output name to a (len(names), n) array
+    """
+    options.setdefault("record_every", options.get("num_steps", NUM_STEPS) - 1)
+    trajectory = forward_sensitivities(parameters, names, **options)
+    values = np.array([parameters[name] for name in names], dtype=float)
+    result = {}
+    for output in outputs:
+        final = trajectory[output][:, -1]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            result[output] = trajectory["sensitivities"][COMPARTMENTS.index(output), ..., -1] * values / final
+    return result
+
+
+def evaluate_chunk(parameters, outputs=OUTPUTS, num_steps=NUM_STEPS, time_step=TIME_STEP):
+    """Integrate a batch with the fused Euler step, and return the final value of every output, (len(outputs), n)"""
+    trajectory = integrate(parameters, num_steps=num_steps, time_step=time_step, order="fused",
+                           record_every=max(num_steps - 1, 1))
+    return np.array([trajectory[output][:, -1] for output in outputs])
+
+
+def evaluate(parameters, outputs=OUTPUTS, num_steps=NUM_STEPS, time_step=TIME_STEP, chunk_size=CHUNK_SIZE,
+             workers=None):
+    """
+    Evaluate the outputs of a large batch, split to chunks that are integrated in parallel by a process pool.
+    :param workers: Number of worker processes, defaults to the number of CPUs
+    :return: The final value of every output, (len(outputs), n)
+    """
+    n = len(parameters["alpha"])
+    chunks = [{name: values[start:start + chunk_size] for name, values in parameters.items()}
+              for start in range(0, n, chunk_size)]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        results = list(executor.map(evaluate_chunk, chunks, repeat(outputs), repeat(num_steps), repeat(time_step)))
+    return np.concatenate(results, axis=1)
+
+
+def saltelli_design(base, names, samples=SOBOL_SAMPLES, spread=SPREAD, seed=None):
+    """
+    The Saltelli design for Sobol indices: two independent quasi random sample matrices A and B of the parameters,
+    and for every parameter the matrix A with that parameter taken from B.
+    :param base: Parameters of a single member batch, the center of the ranges
+    :param samples: Number of rows of A and B, a power of 2 keeps the Sobol sequence balanced
+    :return: Parameters of the batch of samples * (len(names) + 2) members, ordered A, B, then every AB
+    """
+    d = len(names)
+    sample = qmc.Sobol(2 * d, seed=seed).random(samples)
+    centers = np.array([base[name][0] for name in names], dtype=float)
+    # parameters that are 0 at the base stay 0
+    a = centers * (1 + spread * (2 * sample[:, :d] - 1))
+    b = centers * (1 + spread * (2 * sample[:, d:] - 1))
+    blocks = [a, b]
+    for k in range(d):
+        ab = a.copy()
+        ab[:, k] = b[:, k]
+        blocks.append(ab)
+    design = np.concatenate(blocks)
+    parameters = {name: np.repeat(values, len(design)) for name, values in base.items()}
+    for k, name in enumerate(names):
+        parameters[name] = design[:, k]
+    return parameters
+
+
+def sobol_indices(values, samples, d):
+    """
+    First order indices by the estimator of Saltelli et al. (2010), and total order indices by the estimator of Jansen,
+    from evaluations of a Saltelli design.
+    :param values: Evaluations of an output over the design, (samples * (d + 2),)
+    :return: First and total order indices, (d,) each
+    """
+    f_a, f_b = values[:samples], values[samples:2 * samples]
+    f_ab = values[2 * samples:].reshape(d, samples)
+    variance = np.var(np.concatenate([f_a, f_b]))
+    first = np.mean(f_b * (f_ab - f_a), axis=1) / variance
+    total = 0.5 * np.mean((f_a - f_ab) ** 2, axis=1) / variance
+    return first, total
+
+
+def sobol_analysis(scenario="Treatment", names=SENSITIVITY_PARAMETERS, outputs=OUTPUTS, samples=SOBOL_SAMPLES,
+                   spread=SPREAD, seed=None, **options):
+    """
+    Variance based global sensitivity of the final outputs of a scenario of HIV_model to its parameters.
+    :param scenario: Name of a scenario from HIV_batch.SCENARIOS, whose parameters are the centers of the ranges
+    :param options: Passed on to evaluate
+    :return: Dictionary of output name to a dictionary with the "first" and "total" order index of every parameter
+    """
+    base = scenario_parameters([scenario])
+    parameters = saltelli_design(base, names, samples, spread, seed)
+    values = evaluate(parameters, outputs, **options)
+    result = {}
+    for output, output_values in zip(outputs, values):
+        first, total = sobol_indices(output_values, samples, len(names))
+        result[output] = {"first": dict(zip(names, first)), "total": dict(zip(names, total))}
+    return result
+
+
+if __name__ == '__main__':
+    for scenario in ("Latent after Equilibrium", "Treatment"):
+        local = normalized_sensitivities(scenario_parameters([scenario]))
+        for output in OUTPUTS:
+            ranked = sorted(zip(SENSITIVITY_PARAMETERS, local[output][:, 0]), key=lambda item: -abs(item[1]))
+            print(f"{scenario}, final {output}, local sensitivities: "
+                  + ", ".join(f"{name} {value:.3g}" for name, value in ranked))
+
+    indices = sobol_analysis(seed=0)
+    for output in OUTPUTS:
+        print(f"Treatment, final {output}, Sobol indices (first / total):")
+        for name in sorted(SENSITIVITY_PARAMETERS, key=lambda name: -indices[output]["total"][name]):
+            print(f"    {name:<28} {indices[output]['first'][name]:>7.3f} {indices[output]['total'][name]:>7.3f}")
@@ -0,0 +1,214 @@
+import numpy as np
+from plotly import graph_objects as go
+
+from HIV_model import RUN_TIME
+from HIV_batch import COMPARTMENTS, SCENARIOS, scenario_parameters, initial_state
+
+import common_path  # puts the shared modules of common/ on the path
+from render import Renderer
+
+REACTIONS = ("production", "uninfected_death", "infection_to_latent", "infection_to_infected", "activation",
+             "latent_death", "infected_death", "virion_production", "virion_clearance", "treatment_kill")
+# change of every compartment, in the order of COMPARTMENTS, by one firing of every reaction, in the order of REACTIONS
+STOICHIOMETRY = np.array([
+    # production, deaths and infection of uninfected cells
+    [0, 1, 0, 0], [0, -1, 0, 0], [0, -1, 1, 0], [0, -1, 0, 1],
+    # activation and death of latent cells, death of infected cells
+    [0, 0, -1, 1], [0, 0, -1, 0], [0, 0, 0, -1],
+    # production, clearance and treatment kill of virions
+    [1, 0, 0, 0], [-1, 0, 0, 0], [-1, 0, 0, 0],
+]).T
+# highest order of the reactions every compartment takes part in, for the step size selection
+HIGHEST_ORDER = np.array([2, 2, 1, 1])[:, None]
+
+# bound on the relative change of the propensities in a leap
+EPSILON = 0.03
+# a leap shorter than this many mean waiting times between reactions is replaced by an exact Gillespie step
+EXACT_THRESHOLD = 10
+RECORD_EVERY = 10  # days
+REPLICATES = 1000
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+
+def replicate(parameters, replicates):
+    """
+    Repeat every member of a batch, to run replicate stochastic trajectories of it.
+    :param parameters: Parameters of a batch, as returned by HIV_batch.make_parameters
+    :return: Parameters of a batch where every member is repeated replicates times in a row
+    """
+    return {name: np.repeat(values, replicates) for name, values in parameters.items()}
+
+
+def propensities(x, parameters, latent_rate):
+    """
+    The rate at which every reaction fires, the terms of HIV_batch.RATE_LAWS.
+    :param x: Number of virions and cells, with the compartments in the order of COMPARTMENTS, (4, n)
+    :param parameters: Parameters of the batch, (n,) each
+    :param latent_rate: Rate of activation of latent cells, (n,)
+    :return: Propensities in the order of REACTIONS, (10, n)
+    """
+    virion, uninfected, latent, infected = x
+    p = parameters
+    infection = p["virion_infection_rate"] * uninfected * virion
+    return np.array([
+        p["uninfected_production"] + 0 * virion,
+        p["uninfected_death_rate"] * uninfected,
+        p["uninfected_to_latent_rate"] * infection,
+        (1 - p["uninfected_to_latent_rate"]) * infection,
+        latent_rate * latent,
+        p["latent_death_rate"] * latent,
+        p["infected_death_rate"] * infected,
+        p["alpha"] * infected,
+        p["virus_death_rate"] * virion,
+        p["treatment"] * p["treatment_kill_rate"] * virion,
+    ])
+
+
+def leap_size(x, rates, epsilon=EPSILON):
+    """
+    The largest leap over which no propensity is expected to change by more than epsilon of itself, by the bounds on
+    the mean and variance of the change of every compartment of Cao, Gillespie and Petzold.
+    :param x: State, (4, n)
+    :param rates: Propensities, (10, n)
+    :return: Leap size, (n,)
+    """
+    mean = STOICHIOMETRY @ rates
+    variance = (STOICHIOMETRY ** 2) @ rates
+    bound = np.maximum(epsilon * x / HIGHEST_ORDER, 1)
+    with np.errstate(divide="ignore"):
+        tau = np.minimum(bound / np.abs(mean), bound ** 2 / variance)
+    return np.min(tau, axis=0)
+
+
+def advance(x, t, stop, parameters, rng, epsilon=EPSILON):
+    """
+    Advance every member of a batch by one leap, or by one exact Gillespie step where the leap would be too short to be
+    worth it, without passing its stop time.
+    :param x: State, (4, n), updated in place
+    :param t: Time of every member, (n,), updated in place
+    :param stop: Time every member must stop at, (n,)
+    """
+    latent_rate = np.where(t < parameters["latent_beginning"], parameters["latent_rate_before"],
+                           parameters["latent_rate_after"])
+    rates = propensities(x, parameters, latent_rate)
+    total = rates.sum(axis=0)
+    tau = np.minimum(leap_size(x, rates, epsilon), stop - t)
+    with np.errstate(divide="ignore"):
+        exact = tau < EXACT_THRESHOLD / total
+
+    # exact steps: wait for the next reaction, and fire it if it comes before the stop time
+    members = np.flatnonzero(exact)
+    if len(members):
+        with np.errstate(divide="ignore"):
+            wait = rng.exponential(1 / total[members])
+        fires = wait < stop[members] - t[members]
+        firing = members[fires]
+        cumulative = np.cumsum(rates[:, firing], axis=0)
+        chosen = np.sum(cumulative < rng.random(len(firing)) * total[firing], axis=0)
+        x[:, firing] += STOICHIOMETRY[:, np.minimum(chosen, len(REACTIONS) - 1)]
+        t[members] = np.where(fires, t[members] + wait, stop[members])
+
+    # leaps: fire every reaction a Poisson number of times, halving the leap of members that went negative
+    members = np.flatnonzero(~exact)
+    tau = tau[members]
+    while len(members):
+        change = STOICHIOMETRY @ rng.poisson(rates[:, members] * tau)
+        valid = np.all(x[:, members] + change >= 0, axis=0)
+        accepted = members[valid]
+        x[:, accepted] += change[:, valid]
+        t[accepted] = np.where(tau[valid] == stop[accepted] - t[accepted], stop[accepted], t[accepted] + tau[valid])
+        members, tau = members[~valid], tau[~valid] / 2
+
+
+def simulate(parameters, state=None, run_time=RUN_TIME, record_every=RECORD_EVERY, epsilon=EPSILON, seed=None):
+    """
+    Simulate a batch of stochastic trajectories with adaptive tau leaping, advancing all members together.
+    Every member takes its own leaps, and stops at every recorded time and at the latent beginning, where latent_rate
+    switches.
+    :param parameters: Parameters of the batch, as returned by HIV_batch.make_parameters, or replicate for copies
+    :param state: Initial state of the batch, defaults to HIV_batch.initial_state(parameters), rounded to whole cells
+    :param run_time: Length of the run in days
+    :param record_every: Record the state every that many days, and at run_time
+    :param epsilon: Bound on the relative change of the propensities in a leap, smaller is more accurate and slower
+    :param seed: Seed of the random generator
+    :return: Dictionary with the recorded "time" (t,) and every compartment as an (n, t) array of counts
+    """
+    rng = np.random.default_rng(seed)
+    state = initial_state(parameters) if state is None else state
+    x = np.array([np.rint(state[name]) for name in COMPARTMENTS], dtype=np.int64)
+    n = x.shape[1]
+    t = np.zeros(n)
+
+    # the last recorded time is run_time itself, also when it is not a multiple of record_every
+    times = np.unique(np.minimum(np.arange(0, run_time + record_every, record_every), run_time))
+    trajectory = {name: np.empty((n, len(times)), dtype=np.int64) for name in COMPARTMENTS}
+    for k, name in enumerate(COMPARTMENTS):
+        trajectory[name][:, 0] = x[k]
+
+    for record, record_time in enumerate(times[1:], 1):
+        # the running members are advanced in their own compact arrays, which are gathered again only when some of
+        # them reach the recorded time
+        running = np.flatnonzero(t < record_time)
+        while len(running):
+            running_parameters = {name: values[running] for name, values in parameters.items()}
+            running_x, running_t = x[:, running], t[running]
+            while np.all(running_t < record_time):
+                stop = np.where(running_t < running_parameters["latent_beginning"],
+                                np.minimum(running_parameters["latent_beginning"], record_time), record_time)
+                advance(running_x, running_t, stop, running_parameters, rng, epsilon)
+            x[:, running], t[running] = running_x, running_t
+            running = running[running_t < record_time]
+        for k, name in enumerate(COMPARTMENTS):
+            trajectory[name][:, record] = x[k]
+
+    trajectory["time"] = times
+    return trajectory
+
+
+def summarize(trajectory, replicates, quantiles=QUANTILES):
+    """
+    Summarize a batch of replicate trajectories, as made by simulate on parameters made by replicate.
+    :param replicates: Number of replicates of every parameter set in the batch
+    :return: Dictionary with the "time", the quantiles of every compartment over the replicates as (m, q, t) arrays,
+    the probability the infection went extinct, with no virions, latent or infected cells left, as "infection_extinct"
+    and the probability the latent reservoir is empty as "latent_extinct", both (m, t)
+    """
+    summary = {"time": trajectory["time"], "quantiles": np.asarray(quantiles)}
+    grouped = {name: trajectory[name].reshape(-1, replicates, len(trajectory["time"])) for name in COMPARTMENTS}
+    for name in COMPARTMENTS:
+        summary[name] = np.moveaxis(np.quantile(grouped[name], quantiles, axis=1), 0, 1)
+    infection = grouped["virion"] + grouped["latent"] + grouped["infected"]
+    summary["infection_extinct"] = np.mean(infection == 0, axis=1)
+    summary["latent_extinct"] = np.mean(grouped["latent"] == 0, axis=1)
+    return summary
+
+
+def plot_bands(summary, member, title):
+    """Plot the median of every compartment of a summarized member, with the band between the outer quantiles"""
+    time = summary["time"]
+    fig = go.Figure()
+    for name in COMPARTMENTS:
+        bands = summary[name][member]
+        fig.add_trace(go.Scatter(x=np.concatenate([time, time[::-1]]), y=np.concatenate([bands[-1], bands[0][::-1]]),
+                                 fill="toself", opacity=0.3, line=dict(width=0), hoverinfo="skip",
+                                 name=f"{name.capitalize()} {summary['quantiles'][0]:g}-{summary['quantiles'][-1]:g}"))
+        fig.add_trace(go.Scatter(x=time, y=bands[len(bands) // 2], name=f"{name.capitalize()} median"))
+    fig.update_layout(title=title, xaxis_title="Time (days)", yaxis_title="Number of cells")
+    return fig
+
+
+if __name__ == '__main__':
+    parameters = scenario_parameters()
+    summary = summarize(simulate(replicate(parameters, REPLICATES), seed=0), REPLICATES)
+    with Renderer() as renderer:
+        for k, scenario in enumerate(SCENARIOS):
+            at_latent_beginning = np.searchsorted(summary["time"], parameters["latent_beginning"][k])
+            print(f"{scenario}: infection extinct by the latent beginning in "
+                  f"{summary['infection_extinct'][k, at_latent_beginning]:.1%} of {REPLICATES} runs")
+            medians = ", ".join(f"{name} {summary[name][k, len(QUANTILES) // 2, -1]:g} "
+                                f"({summary[name][k, 0, -1]:g}-{summary[name][k, -1, -1]:g})" for name in COMPARTMENTS)
+            print(f"{scenario}: infection extinct in {summary['infection_extinct'][k, -1]:.1%} of {REPLICATES} runs, "
+                  f"latent reservoir empty in {summary['latent_extinct'][k, -1]:.1%}. Final {medians}")
+            fig = plot_bands(summary, k, f"Stochastic HIV model, {scenario}")
+            renderer.save(fig, f"../Figs/HIV Stochastic {scenario}.html", full_html=False, include_plotlyjs='cdn')
+            renderer.show(fig)
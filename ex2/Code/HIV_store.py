@@ -0,0 +1,109 @@
+import json
+import os
+
+import numpy as np
+from plotly import graph_objects as go
+
+COMPARTMENTS = ("virion", "uninfected", "latent", "infected")
+STORE_DIRECTORY = "../Results"
+# largest number of points drawn for every trace
+POINT_BUDGET = 2000
+
+
+def run_path(name, directory=STORE_DIRECTORY):
+    return os.path.join(directory, name)
+
+
+def save_run(name, time, compartments, metadata, directory=STORE_DIRECTORY):
+    """
+    Save a simulation to the trajectory store, as one .npy column per array, so it can be memory mapped back.
+    :param name: Name of the run, its directory in the store
+    :param time: The time of every recorded step, (t,)
+    :param compartments: Dictionary of compartment name to its values, (t,) for one member or (n, t) for a batch
+    :param metadata: Parameters and anything else describing the run, must be json serializable
+    """
+    path = run_path(name, directory)
+    os.makedirs(path, exist_ok=True)
+    np.save(os.path.join(path, "time.npy"), np.asarray(time, dtype=float))
+    for compartment, values in compartments.items():
+        np.save(os.path.join(path, f"{compartment}.npy"), np.asarray(values, dtype=float))
+    # the metadata is written last, so a run without it was not saved completely
+    with open(os.path.join(path, "metadata.json"), "w") as file:
+        json.dump({"columns": ["time"] + list(compartments), **metadata}, file, indent=2)
+
+
+def load_metadata(name, directory=STORE_DIRECTORY):
+    """Load the metadata of a stored run, or None if there is no complete run with that name"""
+    try:
+        with open(os.path.join(run_path(name, directory), "metadata.json")) as file:
+            return json.load(file)
+    except FileNotFoundError:
+        return None
+
+
+def is_stored(name, metadata, directory=STORE_DIRECTORY):
+    """Check if a run with the given name and the same metadata is already in the store"""
+    stored = load_metadata(name, directory)
+    return stored is not None and {key: stored[key] for key in stored if key != "columns"} == \
+        json.loads(json.dumps(metadata))
+
+
+def load_run(name, directory=STORE_DIRECTORY):
+    """
+    Load a run from the trajectory store without reading it to memory.
+    :return: Dictionary of column name to a read only memory mapped array, and "metadata"
+    """
+    metadata = load_metadata(name, directory)
+    if metadata is None:
+        raise FileNotFoundError(f"There is no stored run named {name}")
+    run = {column: np.load(os.path.join(run_path(name, directory), f"{column}.npy"), mmap_mode="r")
+           for column in metadata["columns"]}
+    run["metadata"] = metadata
+    return run
+
+
+def lttb(x, y, budget=POINT_BUDGET):
+    """
+    Downsample a trace with the largest triangle three buckets algorithm, which keeps the points that shape the line.
+    The first and last points are always kept, and every bucket in between contributes the point forming the largest
+    triangle with the point kept in the previous bucket and the mean of the next bucket.
+    :param x: The x values of the trace, increasing, (t,)
+    :param y: The y values of the trace, (t,)
+    :param budget: Number of points to keep
+    :return: The indices of the kept points
+    """
+    length = len(x)
+    if budget >= length or budget < 3:
+        return np.arange(length)
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    edges = np.linspace(1, length - 1, budget - 1).astype(int)
+    indices = np.empty(budget, dtype=int)
+    indices[0], indices[-1] = 0, length - 1
+    previous = 0
+    for bucket in range(budget - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_start, next_stop = stop, edges[bucket + 2] if bucket + 2 < len(edges) else length
+        mean_x, mean_y = x[next_start:next_stop].mean(), y[next_start:next_stop].mean()
+        areas = np.abs((x[previous] - mean_x) * (y[start:stop] - y[previous])
+                       - (x[previous] - x[start:stop]) * (mean_y - y[previous]))
+        previous = start + int(np.argmax(areas))
+        indices[bucket + 1] = previous
+    return indices
+
+
+def plot_run(name, title, member=None, point_budget=POINT_BUDGET, directory=STORE_DIRECTORY):
+    """
+    Plot every compartment of a stored run, downsampled to the point budget.
+    :param member: Index of the member to plot, for runs of a batch
+    :return: The plotly figure
+    """
+    run = load_run(name, directory)
+    time = np.asarray(run["time"])
+    fig = go.Figure()
+    for compartment in COMPARTMENTS:
+        values = run[compartment] if member is None else run[compartment][member]
+        indices = lttb(time, values, point_budget)
+        fig.add_trace(go.Scatter(x=time[indices], y=np.asarray(values[indices]), name=compartment.capitalize()))
+    fig.update_layout(title=title, xaxis_title="Time (days)", yaxis_title="Number of cells")
+    return fig
@@ -1,64 +1,77 @@
+import argparse
+
 import numpy as np
 import plotly.graph_objects as go
-from scipy.stats import zscore, norm
-
+import scipy.sparse as sp
 
-def create_common_neighbours_matrix(matrix):
-    """
-    Create a matrix where each cell is the number of common neighbours between the i'th and j'th gene.
-    :param matrix: The binarized matrix of interactions
-    :return: The matrix of common neighbours
-    """
-    # Remove the diagonal, as we don't want to count the gene itself as a common neighbour
-    np.fill_diagonal(matrix, 0)
+from adjacency import load_matrix
 
-    # Create the common neighbours matrix, by multiplying the matrix by itself
-    common_neighbours_matrix = matrix @ matrix
+import common_path  # puts the shared modules of common/ on the path
+from render import Renderer
 
-    return common_neighbours_matrix
+# number of rows of the common neighbours matrix computed at once
+BLOCK_SIZE = 1024
 
 
-def create_any_interaction_matrix(matrix):
+def common_neighbours_histogram(matrix, block_size=BLOCK_SIZE):
     """
-    Create a matrix where each cell is the total number of interactions between the i'th and j'th gene, no matter the
-    sign of the interaction, and who is the regulator and who is the regulated.
-    :param matrix: The matrix of interactions
-    :return: The matrix of any interactions
+    Count, for every number of common neighbours, the pairs of different nodes with that many common neighbours, and
+    how many of them interact. The common neighbours are computed with sparse matrices, a block of rows at a time, and
+    only for the pairs that have any, so neither the full common neighbours matrix nor the list of all the pairs is
+    ever held. The pairs with no common neighbours are the rest of the n * (n - 1) / 2 pairs.
+    :param matrix: The matrix of interactions, dense or scipy sparse
+    :param block_size: Number of rows of the common neighbours matrix computed at once
+    :return: The number of pairs, and the number of interacting pairs, with every number of common neighbours
     """
-    abs_matrix = np.abs(matrix)
-    total_interactions = abs_matrix + abs_matrix.T
-
-    # Binarize the matrix
-    binarized_matrix = np.where(total_interactions > 0, 1, 0)
-    return binarized_matrix
-
-
-def check_neighbours_rule(matrix, domain):
-    # Create the binarized matrix, which tells if there is any interaction between the i'th and j'th gene.
-    binarized_matrix = create_any_interaction_matrix(matrix)
-    common_neighbours_matrix = create_common_neighbours_matrix(binarized_matrix)
-    # get the upper triangle of the interactions matrix, without the diagonal, to an array
-    upper_triangle_interactions = binarized_matrix[np.triu_indices(binarized_matrix.shape[0], k=1)]
-    # get the upper triangle of the neighbours matrix, without the diagonal, to an array
-
-    upper_triangle_neighbours = common_neighbours_matrix[np.triu_indices(common_neighbours_matrix.shape[0], k=1)]
-    # plot a histogram of the number of interaction genes, as a function of number of common neighbours, using plotly
+    # the binarized matrix of any interaction, without the diagonal
+    interactions = abs(sp.csr_matrix(matrix))
+    interactions = sp.csr_matrix((interactions + interactions.T) != 0, dtype=np.int64)
+    interactions.setdiag(0)
+    interactions.eliminate_zeros()
+    n = interactions.shape[0]
+
+    pairs, interacting = np.zeros(1, dtype=np.int64), np.zeros(1, dtype=np.int64)
+    for start in range(0, n, block_size):
+        block = interactions[start:start + block_size]
+        # keep only the pairs above the diagonal, every pair once
+        common = sp.triu(block @ interactions, k=start + 1).tocsr()
+        length = max(len(pairs), common.data.max(initial=0) + 1)
+        pairs = np.pad(pairs, (0, length - len(pairs))) + np.bincount(common.data, minlength=length)
+        interacting = (np.pad(interacting, (0, length - len(interacting)))
+                       + np.bincount(common.multiply(block).tocsr().data, minlength=length))
+
+    pairs[0] = n * (n - 1) // 2 - np.sum(pairs[1:])
+    interacting[0] = interactions.nnz // 2 - np.sum(interacting[1:])
+    return pairs, interacting
+
+
+def check_neighbours_rule(matrix, domain, block_size=BLOCK_SIZE, renderer=None):
+    """
+    Plot the probability of interaction between two nodes as a function of their number of common neighbours.
+    :param renderer: The render.Renderer to write the figure with, defaults to writing it right away
+    :return: The number of pairs, and the number of interacting pairs, with every number of common neighbours
+    """
+    pairs, interacting = common_neighbours_histogram(matrix, block_size)
+    neighbours = np.flatnonzero(pairs)
+    # plot the probability of interaction for every number of common neighbours, using plotly
     fig = go.Figure()
-    fig.add_trace(go.Histogram(x=upper_triangle_neighbours, y=upper_triangle_interactions, histfunc="avg",
-                               marker=dict(line=dict(color="black", width=2))))
+    fig.add_trace(go.Bar(x=neighbours, y=interacting[neighbours] / pairs[neighbours],
+                         marker=dict(line=dict(color="black", width=2))))
 
     fig.update_layout(title=f"The Probability of Interactions between two {domain} as a Function of Common Neighbours",
                       xaxis_title="Number of common neighbours",
                       yaxis_title=f"Probability of interaction between two {domain}",
                       bargap=0.1)
-    fig.write_html(f"../Figs/{domain}.html")
-    fig.show()
-    return common_neighbours_matrix
+    renderer = Renderer(workers=0) if renderer is None else renderer
+    renderer.save(fig, f"../Figs/{domain}.html")
+    renderer.show(fig)
+    return pairs, interacting
 
 
-def count_motifs(matrix, verbose=False):
+def count_motifs_loop(matrix, verbose=False):
     """
-    Count the number of occurrences of the given motif as described in the exercise, in the given matrix.
+    Count the number of occurrences of the given motif as described in the exercise, in the given matrix, one node at
+    a time. Slow, kept as the reference for count_motifs.
     """
 
     # Calculate total interactions number for each two nodes
@@ -80,14 +93,14 @@ def count_motifs(matrix, verbose=False):
     for interaction in mutual_interactions_coordinates:
         Y = interaction[0]
         W = interaction[1]
-        for X in range(celeg_matrix.shape[0]):
+        for X in range(matrix.shape[0]):
             # check if exists Y->X->W
-            if ((celeg_matrix[Y, X] != 0 and celeg_matrix[X, Y] == 0 and celeg_matrix[X, W] != 0)
-                    and celeg_matrix[W, X] == 0) and X != W and X != Y:
+            if ((matrix[Y, X] != 0 and matrix[X, Y] == 0 and matrix[X, W] != 0)
+                    and matrix[W, X] == 0) and X != W and X != Y:
                 # check if exists Y->Z
-                for Z in range(celeg_matrix.shape[0]):
-                    if celeg_matrix[W, Z] == 0 and celeg_matrix[Z, W] == 0 and celeg_matrix[Z, Y] == 0 and\
-                            celeg_matrix[Y, Z] != 0 and celeg_matrix[X, Z] == 0 and celeg_matrix[Z, X] == 0 and\
+                for Z in range(matrix.shape[0]):
+                    if matrix[W, Z] == 0 and matrix[Z, W] == 0 and matrix[Z, Y] == 0 and\
+                            matrix[Y, Z] != 0 and matrix[X, Z] == 0 and matrix[Z, X] == 0 and\
                             Z != W and Z != Y and Z != X:
                         motif_in_network.append([W, X, Y, Z])
 
@@ -98,10 +111,88 @@ def count_motifs(matrix, verbose=False):
     return num_motifs
 
 
+def motif_relations(matrix):
+    """
+    The relations between every two nodes that the motif is made of.
+    :param matrix: The dense matrix of interactions
+    :return: The one way matrix, where [i, j] is whether i regulates j and j doesn't regulate i, the no interaction
+    matrix, where [i, j] is whether there is no interaction between the different nodes i and j, and the coordinates
+    (Y, W) of the mutual interactions
+    """
+    binarized = np.abs(matrix) != 0
+    one_way = binarized & ~binarized.T
+    no_interaction = ~(binarized | binarized.T)
+    np.fill_diagonal(no_interaction, False)
+    mutual = binarized & binarized.T
+    np.fill_diagonal(mutual, False)
+    return one_way, no_interaction, np.nonzero(mutual)
+
+
+def count_motifs(matrix, verbose=False, sparse=False):
+    """
+    Count the number of occurrences of the given motif as described in the exercise, in the given matrix: Y<->W,
+    Y->X->W and Y->Z, where every other two of the nodes don't interact, and every edge is one way unless stated.
+    For every mutual pair (Y, W), the X's are the nodes with Y->X and X->W, and for each of them the Z's are the nodes
+    with Y->Z that don't interact with W and X, so the count is the sum over the pairs and X's of
+    (one_way[Y] & no_interaction[W]) @ no_interaction[X]. Gives the same count as count_motifs_loop.
+    :param matrix: The matrix of interactions, dense or scipy sparse
+    :param sparse: Use scipy sparse matrices, for large networks with few interactions
+    :return: The number of motifs
+    """
+    if sparse:
+        num_motifs, mutual_interactions = count_motifs_sparse(matrix)
+    else:
+        one_way, no_interaction, (ys, ws) = motif_relations(matrix.toarray() if sp.issparse(matrix)
+                                                            else np.asarray(matrix))
+        mutual_interactions = len(ys)
+        # the Z's that fit the pair without X, and the X's of every pair, (M, n) each
+        z_candidates = (one_way[ys] & no_interaction[ws]).astype(float)
+        x_candidates = one_way[ys] & one_way[:, ws].T
+        num_motifs = int(np.sum((z_candidates @ no_interaction.T.astype(float))[x_candidates]))
+
+    if verbose:
+        print("Number of mutual interactions in Matrix: ", mutual_interactions)
+        print("Number of Motifs in network: ", num_motifs)
+    return num_motifs
+
+
+def count_motifs_sparse(matrix):
+    """
+    The sparse path of count_motifs. The no interaction matrix is dense, so it is expressed by its complement, the any
+    interaction matrix: for Z != X, no_interaction[X, Z] = 1 - interaction[X, Z].
+    :return: The number of motifs, and the number of mutual interactions
+    """
+    binarized = sp.csr_matrix(abs(sp.csr_matrix(matrix)) != 0, dtype=np.int64)
+    transposed = binarized.T.tocsr()
+    one_way = binarized - binarized.multiply(transposed)
+    interaction = ((binarized + transposed) != 0).astype(np.int64)
+    interaction.setdiag(0)
+    interaction.eliminate_zeros()
+    mutual = sp.triu(binarized.multiply(transposed), k=1) + sp.tril(binarized.multiply(transposed), k=-1)
+    ys, ws = mutual.nonzero()
+
+    one_way_y = one_way[ys]
+    z_candidates = one_way_y - one_way_y.multiply(interaction[ws])
+    x_candidates = one_way_y.multiply(one_way.T.tocsr()[ws]).tocsr()
+    # sum over the pairs and X's of the Z candidates that are not X, and don't interact with X
+    all_z = np.asarray(z_candidates.sum(axis=1)).ravel() @ np.asarray(x_candidates.sum(axis=1)).ravel()
+    z_is_x = x_candidates.multiply(z_candidates).sum()
+    z_interacts_with_x = x_candidates.multiply(z_candidates @ interaction.T).sum()
+    return int(all_z - z_is_x - z_interacts_with_x), len(ys)
+
+
 if __name__ == '__main__':
+    # imported here, as null_models imports count_motifs from this module
+    from null_models import NULL_MODELS, RANDOMIZATIONS, null_distribution, significance
+
+    parser = argparse.ArgumentParser(description='Network motifs of the E. coli and C. elegans networks')
+    parser.add_argument('--randomizations', '-r', type=int, default=RANDOMIZATIONS,
+                        help='Number of randomized networks of every null model')
+    args = parser.parse_args()
+
     # load the coliAdj.txt and elegansAdj.txt to numpy arrays
-    ecoly_matrix = np.genfromtxt("../Resources/coliAdj.txt", delimiter=',', invalid_raise=False)
-    celeg_matrix = np.genfromtxt("../Resources/elegansAdj.txt", delimiter=' ', invalid_raise=False, dtype=np.int32)
+    ecoly_matrix = load_matrix("../Resources/coliAdj.txt", delimiter=',')
+    celeg_matrix = load_matrix("../Resources/elegansAdj.txt")
 
     # Q1
     print("Number of Transcription Factors: ", np.sum(np.count_nonzero(ecoly_matrix, axis=1) >= 1))
@@ -118,54 +209,42 @@ if __name__ == '__main__':
     non_regulated = np.sum(np.count_nonzero(ecoly_matrix, axis=0) == 0)
     print("Number of non regulated genes: ", non_regulated)
 
-    # Q4a
-    check_neighbours_rule(
-        ecoly_matrix,
-        domain="E. coli genes"
-    )
-
-    # Q5a
-    abs_matrix = np.abs(ecoly_matrix)
-    total_interactions = abs_matrix + abs_matrix.T
-    np.fill_diagonal(total_interactions, 0)
-    mutual_interactions = np.sum(total_interactions == 2)
-    print("Number of mutual interactions in E. coly: ", mutual_interactions)
-    # There are 0 mutual interactions in the E. coly network, which means there are no Y<->W interactions,
-    # therefore the motif doesn't exist in the network
-
-    # Q4b
-    check_neighbours_rule(
-        celeg_matrix,
-        domain="C. elegans neurons"
-    )
-
-    #Q5b
-    # count the number of mutual interactions in the celeg matrix
-    num_orig_motifs = count_motifs(celeg_matrix, verbose=True)
-
-    # randomize the celeg matrix 100 times, and count the number of motifs in each randomization
-    num_motifs = []
-    for i in range(100):
-        print(f"Randomization number {i}")
-        shuffled = np.random.permutation(celeg_matrix.flatten()).reshape(celeg_matrix.shape)
-        num_motifs.append(count_motifs(shuffled))
-        print(num_motifs[i])
-
-    # Calculate the Z-score and p-value of the number of motifs in the original celeg matrix
-    z_score = (num_orig_motifs - np.mean(num_motifs)) / np.std(num_motifs)
-    p_value = 1 - norm.cdf(z_score)
-    print("Z-score: ", z_score)
-    print("p-value: ", p_value)
-
-
-
-
-
-
-
-
-
-
-
-
-
+    with Renderer() as renderer:
+        # Q4a
+        check_neighbours_rule(
+            ecoly_matrix,
+            domain="E. coli genes",
+            renderer=renderer
+        )
+
+        # Q5a
+        abs_matrix = np.abs(ecoly_matrix)
+        total_interactions = abs_matrix + abs_matrix.T
+        np.fill_diagonal(total_interactions, 0)
+        mutual_interactions = np.sum(total_interactions == 2)
+        print("Number of mutual interactions in E. coly: ", mutual_interactions)
+        # There are 0 mutual interactions in the E. coly network, which means there are no Y<->W interactions,
+        # therefore the motif doesn't exist in the network
+
+        # Q4b
+        check_neighbours_rule(
+            celeg_matrix,
+            domain="C. elegans neurons",
+            renderer=renderer
+        )
+        # the figures are written in the background while the motifs are counted
+
+        #Q5b
+        # count the number of mutual interactions in the celeg matrix
+        num_orig_motifs = count_motifs(celeg_matrix, verbose=True)
+
+        # compare to the motif counts of randomized networks, both shuffled and rewired keeping the degree of every
+        # node
+        for model in NULL_MODELS:
+            num_motifs = null_distribution(celeg_matrix, model=model, randomizations=args.randomizations)
+            result = significance(num_orig_motifs, num_motifs)
+            print(f"Null model {model}, {len(num_motifs)} randomizations: "
+                  f"mean {result['mean'][0]:.1f}, std {result['std'][0]:.1f}")
+            print("Z-score: ", result["z_score"][0])
+            print("p-value: ", result["normal_p_value"][0])
+            print("Empirical p-value: ", result["p_value_greater"][0])
@@ -0,0 +1,61 @@
+import os
+
+import numpy as np
+import scipy.sparse as sp
+
+import common_path  # puts the shared modules of common/ on the path
+from cache import cache_base, is_valid, write_metadata
+
+CACHE_DIRECTORY = ".adjacency_cache"
+# the interactions are -1, 0 or 1, so they are stored as int8
+DTYPE = np.int8
+
+
+def cache_paths(path, kind):
+    """The paths of the cached data and its metadata, in a cache directory next to the source file"""
+    base = f"{cache_base(path, CACHE_DIRECTORY)}.{kind}"
+    return base + (".npy" if kind == "dense" else ".npz"), base + ".json"
+
+
+def load_matrix(path, delimiter=None):
+    """
+    Load a dense text adjacency matrix, as the files in Resources, through the binary cache. The text is parsed only
+    the first time, or when the file changed, and otherwise the cached .npy is memory mapped.
+    :param path: Path of the text file, a row per regulator and a column per regulated
+    :param delimiter: Delimiter of the columns, None for any whitespace
+    :return: Read only int8 matrix of interactions
+    """
+    data_path, metadata_path = cache_paths(path, "dense")
+    options = {"delimiter": delimiter}
+    if not is_valid(metadata_path, path, options):
+        matrix = np.loadtxt(path, delimiter=delimiter, ndmin=2)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        np.save(data_path, matrix.astype(DTYPE))
+        # the metadata is written last, so a cache without it is never used
+        write_metadata(metadata_path, path, options)
+    return np.load(data_path, mmap_mode="r")
+
+
+def load_edge_list(path, delimiter=None, num_nodes=None):
+    """
+    Load an edge list, a line per interaction with the regulator, the regulated and optionally the sign, through the
+    binary cache. The network is never held as a dense matrix, so it can be much larger than the ones in Resources.
+    :param path: Path of the text file, nodes are numbered from 0
+    :param delimiter: Delimiter of the columns, None for any whitespace
+    :param num_nodes: Number of nodes, defaults to the largest node in the list plus 1
+    :return: int8 CSR matrix of interactions
+    """
+    data_path, metadata_path = cache_paths(path, "edges")
+    options = {"delimiter": delimiter, "num_nodes": num_nodes}
+    if not is_valid(metadata_path, path, options):
+        edges = np.loadtxt(path, delimiter=delimiter, ndmin=2)
+        sources, targets = edges[:, 0].astype(np.int64), edges[:, 1].astype(np.int64)
+        signs = edges[:, 2] if edges.shape[1] > 2 else np.ones(len(edges))
+        n = num_nodes if num_nodes is not None else int(max(sources.max(initial=-1), targets.max(initial=-1))) + 1
+        matrix = sp.csr_matrix((signs.astype(DTYPE), (sources, targets)), shape=(n, n))
+        matrix.sum_duplicates()
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        sp.save_npz(data_path, matrix)
+        write_metadata(metadata_path, path, options)
+    return sp.load_npz(data_path).tocsr()
+
@@ -0,0 +1,159 @@
+import itertools
+import time
+from functools import lru_cache
+
+import numpy as np
+
+from adjacency import load_matrix
+from null_models import null_distribution, significance
+
+SIZES = (3, 4)
+NULL_RANDOMIZATIONS = 100
+
+
+def pair_bits(k):
+    """The ordered pairs of different nodes of a k node subgraph, the bit of a pair in its code is its index"""
+    return [(i, j) for i in range(k) for j in range(k) if i != j]
+
+
+@lru_cache(maxsize=None)
+def canonical_table(k):
+    """
+    The lookup table from the code of every k node directed graph to its isomorphism class. The code of a graph has a
+    bit for every ordered pair of nodes, set if the first regulates the second, and its canonical label is the
+    smallest code over all the relabelings of its nodes. Only weakly connected graphs get a class.
+    :return: The canonical label of every class, sorted, and the class of every code, -1 for unconnected graphs
+    """
+    pairs = pair_bits(k)
+    codes = np.arange(2 ** len(pairs))
+    adjacency = np.zeros((len(codes), k, k), dtype=bool)
+    for bit, (i, j) in enumerate(pairs):
+        adjacency[:, i, j] = (codes >> bit) & 1
+    canonical = codes.copy()
+    for permutation in itertools.permutations(range(k)):
+        permuted = sum(adjacency[:, permutation[i], permutation[j]].astype(int) << bit
+                       for bit, (i, j) in enumerate(pairs))
+        canonical = np.minimum(canonical, permuted)
+
+    # a graph is connected if every node is reached from node 0 through k - 1 undirected steps
+    undirected = adjacency | adjacency.transpose(0, 2, 1)
+    reached = np.zeros((len(codes), k), dtype=bool)
+    reached[:, 0] = True
+    for _ in range(k - 1):
+        reached |= np.any(reached[:, :, None] & undirected, axis=1)
+    connected = np.all(reached, axis=1)
+
+    classes = np.unique(canonical[connected])
+    class_of = np.full(len(codes), -1)
+    class_of[connected] = np.searchsorted(classes, canonical[connected])
+    return classes, class_of
+
+
+def enumerate_subgraphs(matrix, k, probabilities=None, rng=None):
+    """
+    Enumerate every connected induced k node subgraph exactly once, with the ESU algorithm of Wernicke. A subgraph is
+    grown from its smallest node v, only by nodes larger than v that neighbour the newest node and no earlier node.
+    With probabilities, it is RAND-ESU: every branch at depth d of the enumeration tree is followed with probability
+    probabilities[d], so every subgraph is found with probability prod(probabilities).
+    :param matrix: The matrix of interactions
+    :param probabilities: Probability to follow a branch at every depth, k values, None to enumerate them all
+    :return: The nodes of every subgraph found, (m, k)
+    """
+    binarized = np.asarray(matrix) != 0
+    undirected = binarized | binarized.T
+    np.fill_diagonal(undirected, False)
+    neighbours = [set(np.flatnonzero(row)) for row in undirected]
+    found = []
+    if probabilities is not None:
+        rng = np.random.default_rng(rng)
+
+    def extend(subgraph, extension, closed, v):
+        if len(subgraph) == k:
+            found.append(subgraph)
+            return
+        extension = list(extension)
+        while extension:
+            w = extension.pop()
+            if probabilities is not None and rng.random() >= probabilities[len(subgraph)]:
+                continue
+            exclusive = [u for u in neighbours[w] if u > v and u not in closed]
+            extend(subgraph + (w,), extension + exclusive, closed | neighbours[w], v)
+
+    for v in range(len(neighbours)):
+        if probabilities is not None and rng.random() >= probabilities[0]:
+            continue
+        extend((v,), [u for u in neighbours[v] if u > v], neighbours[v] | {v}, v)
+    return np.array(found, dtype=int).reshape(-1, k)
+
+
+def classify(matrix, subgraphs):
+    """
+    The isomorphism class of every subgraph, by the code of its induced interactions in canonical_table.
+    :param subgraphs: The nodes of every subgraph, (m, k)
+    :return: The class of every subgraph, (m,)
+    """
+    binarized = np.asarray(matrix) != 0
+    k = subgraphs.shape[1]
+    codes = np.zeros(len(subgraphs), dtype=int)
+    for bit, (i, j) in enumerate(pair_bits(k)):
+        codes |= binarized[subgraphs[:, i], subgraphs[:, j]].astype(int) << bit
+    return canonical_table(k)[1][codes]
+
+
+def census(matrix, k, probabilities=None, seed=None):
+    """
+    Count the connected induced k node subgraphs of every isomorphism class.
+    :param probabilities: Sample with RAND-ESU, following a branch at every depth with these probabilities, the counts
+    are then estimates, scaled up by the probability to find a subgraph
+    :return: The count of every class of canonical_table(k), (number of classes,)
+    """
+    classes = canonical_table(k)[0]
+    subgraphs = enumerate_subgraphs(matrix, k, probabilities, seed)
+    counts = np.bincount(classify(matrix, subgraphs), minlength=len(classes))
+    if probabilities is None:
+        return counts
+    return counts / np.prod(probabilities)
+
+
+def census_3(matrix):
+    """The census of 3 node subgraphs, as a statistic for null_models.null_distribution"""
+    return census(matrix, 3)
+
+
+def census_4(matrix):
+    """The census of 4 node subgraphs, as a statistic for null_models.null_distribution"""
+    return census(matrix, 4)
+
+
+CENSUS_STATISTICS = {3: census_3, 4: census_4}
+
+
+def census_significance(matrix, k, model="switch", randomizations=NULL_RANDOMIZATIONS, seed=0, workers=None):
+    """
+    Compare the census of the network to the censuses of a null ensemble from null_models.
+    :return: The census of the network, and the result of null_models.significance for every class
+    """
+    counts = census(matrix, k)
+    null = null_distribution(matrix, CENSUS_STATISTICS[k], model, randomizations, seed, workers)
+    return counts, significance(counts, null)
+
+
+if __name__ == '__main__':
+    networks = {
+        "E. coli": load_matrix("../Resources/coliAdj.txt", delimiter=','),
+        "C. elegans": load_matrix("../Resources/elegansAdj.txt"),
+    }
+    for domain, matrix in networks.items():
+        for k in SIZES:
+            start = time.perf_counter()
+            counts = census(matrix, k)
+            print(f"{domain}, {k} node census: {int(np.sum(counts))} subgraphs in "
+                  f"{time.perf_counter() - start:.2f} seconds, {np.count_nonzero(counts)} classes found")
+
+        counts, result = census_significance(matrix, 3)
+        classes = canonical_table(3)[0]
+        print(f"{domain}, 3 node classes against {NULL_RANDOMIZATIONS} degree preserving randomizations:")
+        for index in np.argsort(-np.nan_to_num(result["z_score"])):
+            if counts[index]:
+                print(f"    class {classes[index]:>3}: count {counts[index]:>6}, null mean {result['mean'][index]:>9.1f},"
+                      f" Z-score {result['z_score'][index]:>7.2f}, p-value {result['p_value_greater'][index]:.3f}")
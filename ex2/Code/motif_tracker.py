@@ -0,0 +1,181 @@
+import itertools
+import time
+
+import numpy as np
+
+from adjacency import load_matrix
+from Network_motives import count_motifs
+from null_models import SWITCHES_PER_EDGE, edge_switch
+
+# the roles of the motif of count_motifs: Y<->W, Y->X->W and Y->Z, where Z doesn't interact with W and X
+ROLES = ("Y", "W", "X", "Z")
+# relation of every ordered pair of roles, seen from the first: "mutual", "out" for a one way interaction from the
+# first to the second, "in" for a one way interaction from the second to the first, or "none"
+ROLE_RELATIONS = {
+    ("Y", "W"): "mutual", ("W", "Y"): "mutual",
+    ("Y", "X"): "out", ("X", "Y"): "in",
+    ("X", "W"): "out", ("W", "X"): "in",
+    ("Y", "Z"): "out", ("Z", "Y"): "in",
+    ("W", "Z"): "none", ("Z", "W"): "none",
+    ("X", "Z"): "none", ("Z", "X"): "none",
+}
+# the 12 ways to put two nodes in two different roles, with the roles left for the other two nodes
+ROLE_ASSIGNMENTS = [(first, second, tuple(role for role in ROLES if role not in (first, second)))
+                    for first, second in itertools.permutations(ROLES, 2)]
+# code of every relation, for the relation matrix of the tracker
+RELATION_CODES = {"none": 0, "out": 1, "in": 2, "mutual": 3}
+ROLE_CODES = {roles: RELATION_CODES[relation] for roles, relation in ROLE_RELATIONS.items()}
+# number of successful switches between two samples of the chain, per edge. Consecutive samples share most of their
+# wiring, so they are correlated, but after the burn-in every one of them is a sample of the null model
+SAMPLE_SWITCHES_PER_EDGE = 0.1
+
+
+class MotifTracker:
+    """
+    Keeps the count of the motif of count_motifs in step with a network that changes an interaction at a time.
+    Every relation in the motif is fixed, so changing the interaction between u and v only changes the motif instances
+    that hold both u and v. Those are counted before and after the change, by putting u and v in every two roles that
+    their relation fits, and counting the completions of the other two roles from the rows of u and v.
+    With check, every update is compared to a full recount.
+    """
+    def __init__(self, matrix, check=False):
+        self.binarized = np.abs(np.asarray(matrix)) != 0
+        self.check = check
+        # the relation of every node to every other node, as a code of RELATION_CODES, -1 on the diagonal
+        self.codes = (self.binarized.astype(np.int8) + 2 * self.binarized.T.astype(np.int8))
+        np.fill_diagonal(self.codes, -1)
+        self.count = count_motifs(self.binarized)
+
+    def instances_with(self, u, v):
+        """The number of motif instances that hold both u and v"""
+        if u == v:
+            return 0
+        code = self.codes[u, v]
+        u_codes, v_codes = self.codes[u], self.codes[v]
+        total = 0
+        for first, second, (third, fourth) in ROLE_ASSIGNMENTS:
+            if ROLE_CODES[first, second] != code:
+                continue
+            thirds = ((u_codes == ROLE_CODES[first, third]) & (v_codes == ROLE_CODES[second, third])).nonzero()[0]
+            if not len(thirds):
+                continue
+            fourths = ((u_codes == ROLE_CODES[first, fourth]) & (v_codes == ROLE_CODES[second, fourth])).nonzero()[0]
+            if len(fourths):
+                total += int(np.count_nonzero(self.codes[thirds[:, None], fourths] == ROLE_CODES[third, fourth]))
+        return total
+
+    def set_edge(self, u, v, present):
+        """Add or remove the interaction u->v, and update the count"""
+        if self.binarized[u, v] == present:
+            return
+        before = self.instances_with(u, v)
+        self.binarized[u, v] = present
+        self.codes[u, v] = self.binarized[u, v] + 2 * self.binarized[v, u]
+        self.codes[v, u] = self.binarized[v, u] + 2 * self.binarized[u, v]
+        self.count += self.instances_with(u, v) - before
+        if self.check:
+            self.check_count()
+
+    def add_edge(self, u, v):
+        self.set_edge(u, v, True)
+
+    def remove_edge(self, u, v):
+        self.set_edge(u, v, False)
+
+    def switch(self, a, b, c, d):
+        """Switch the interactions a->b and c->d to a->d and c->b, keeping the degree of every node"""
+        if not (self.binarized[a, b] and self.binarized[c, d]):
+            raise ValueError("Both interactions must exist to be switched!")
+        if (a, b) == (c, d):
+            raise ValueError("A switch needs two different interactions!")
+        if a == d or c == b:
+            raise ValueError("A switch must not make self interactions!")
+        if self.binarized[a, d] or self.binarized[c, b]:
+            raise ValueError("A switch must not make interactions that already exist!")
+        self.remove_edge(a, b)
+        self.remove_edge(c, d)
+        self.add_edge(a, d)
+        self.add_edge(c, b)
+
+    def check_count(self):
+        """Compare the tracked count to a full recount"""
+        recount = count_motifs(self.binarized)
+        if recount != self.count:
+            raise RuntimeError(f"Tracked motif count {self.count} differs from the full recount {recount}!")
+
+
+def rewiring_chain(matrix, samples, switches_per_sample=None, burn_in=SWITCHES_PER_EDGE, seed=None, check=False):
+    """
+    Sample null networks from a Markov chain of degree preserving edge switches, one switch at a time, tracking the
+    motif count instead of recounting it for every sample. The chain starts from the network rewired by
+    null_models.edge_switch with burn_in switches per edge, so the first sample has already forgotten the original
+    wiring, as a randomization of null_models does.
+    :param samples: Number of null networks to sample
+    :param switches_per_sample: Number of successful switches between two samples, defaults to
+    SAMPLE_SWITCHES_PER_EDGE of the number of edges
+    :param burn_in: Number of switches per edge before the first sample
+    :param check: Compare every update of the tracker to a full recount
+    :return: The motif count of every sample, (samples,)
+    """
+    rng = np.random.default_rng(seed)
+    tracker = MotifTracker(edge_switch(np.asarray(matrix), rng, burn_in), check)
+    sources, targets = np.nonzero(tracker.binarized)
+    if switches_per_sample is None:
+        switches_per_sample = max(int(SAMPLE_SWITCHES_PER_EDGE * len(sources)), 1)
+    counts = np.empty(samples, dtype=np.int64)
+    for sample in range(samples):
+        switches = 0
+        while switches < switches_per_sample:
+            first, second = rng.choice(len(sources), 2, replace=False)
+            a, b, c, d = sources[first], targets[first], sources[second], targets[second]
+            if a == d or c == b or b == d or tracker.binarized[a, d] or tracker.binarized[c, b]:
+                continue
+            tracker.switch(a, b, c, d)
+            targets[first], targets[second] = d, b
+            switches += 1
+        counts[sample] = tracker.count
+    return counts
+
+
+def sample_costs(matrix, samples, seed=0):
+    """
+    Time a sample of rewiring_chain against a full recount of the motifs, which is the cost of a sample without the
+    tracker. The time of a sample is the difference between chains of 1 and of 1 + samples samples, without burn-in.
+    :return: The time of a tracked sample and of a full recount, in seconds
+    """
+    times = []
+    for num_samples in (1, 1 + samples):
+        start = time.perf_counter()
+        rewiring_chain(matrix, num_samples, burn_in=0, seed=seed)
+        times.append(time.perf_counter() - start)
+    start = time.perf_counter()
+    count_motifs(matrix)
+    return (times[1] - times[0]) / samples, time.perf_counter() - start
+
+
+if __name__ == '__main__':
+    celeg_matrix = load_matrix("../Resources/elegansAdj.txt")
+    rewiring_chain(celeg_matrix, 2, seed=0, check=True)
+    print("The tracked motif count matches the full recount after every change")
+
+    from null_models import null_distribution, significance
+    samples = 1000
+    counts = rewiring_chain(celeg_matrix, samples, seed=0)
+    observed = count_motifs(celeg_matrix)
+    null = null_distribution(celeg_matrix, model="switch", randomizations=samples)
+    for name, values in (("Tracked rewiring chain", counts[:, None]), ("null_models switch", null)):
+        result = significance(observed, values)
+        print(f"{name}, {samples} samples: mean {result['mean'][0]:.1f}, std {result['std'][0]:.1f}, "
+              f"Z-score {result['z_score'][0]:.2f}, observed {observed}")
+
+    # with the thinning of SAMPLE_SWITCHES_PER_EDGE, a tracked sample costs more than recounting the sample from
+    # scratch, the tracker only pays off when the count is needed after every few switches
+    random_matrix = np.random.default_rng(0).random((3000, 3000)) < 0.003
+    np.fill_diagonal(random_matrix, False)
+    for name, matrix, samples in (("C. elegans", np.asarray(celeg_matrix), 20),
+                                  ("random, 3000 nodes", random_matrix, 3)):
+        sample_time, recount_time = sample_costs(matrix, samples)
+        switches = max(int(SAMPLE_SWITCHES_PER_EDGE * np.count_nonzero(matrix)), 1)
+        print(f"{name}: a tracked sample of {switches} switches takes {1000 * sample_time:.1f} ms, a full recount "
+              f"{1000 * recount_time:.1f} ms, so tracking pays off below {switches * recount_time / sample_time:.0f} "
+              f"switches between samples")
@@ -0,0 +1,128 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+import numpy as np
+from scipy.stats import norm
+
+from Network_motives import count_motifs
+
+NULL_MODELS = ("shuffle", "switch")
+RANDOMIZATIONS = 10000
+# number of successful switches to aim for per edge, enough to forget the original wiring
+SWITCHES_PER_EDGE = 10
+# limit on the rounds of switching, as a multiple of the rounds needed when every switch succeeds
+MAX_ROUNDS_FACTOR = 10
+BATCH_SIZE = 100
+
+
+def full_shuffle(matrix, rng):
+    """
+    Shuffle all the cells of the matrix, as the original Q5b did. Keeps the number and signs of the interactions, but
+    not the degree of any node, and puts interactions on the diagonal.
+    """
+    return rng.permutation(matrix.ravel()).reshape(matrix.shape)
+
+
+def edge_switch(matrix, rng, switches_per_edge=SWITCHES_PER_EDGE):
+    """
+    Rewire the network by switching the targets of pairs of edges, a->b and c->d become a->d and c->b, which keeps the
+    in and out degree of every node. Switches that would make a self interaction or an interaction that already exists
+    are rejected. Every round pairs up all the edges at random and makes all the valid switches at once; two switches
+    of a round that would create the same edge are both rejected, so the network stays simple.
+    :param matrix: The matrix of interactions, the value of an edge moves with its source
+    :return: The rewired matrix
+    """
+    n = matrix.shape[0]
+    sources, targets = np.nonzero(matrix)
+    values = matrix[sources, targets]
+    exists = matrix != 0
+    num_edges = len(sources)
+    if num_edges < 2:
+        return np.array(matrix)
+
+    goal, successes = switches_per_edge * num_edges, 0
+    for _ in range(MAX_ROUNDS_FACTOR * -(-goal // (num_edges // 2))):
+        if successes >= goal:
+            break
+        order = rng.permutation(num_edges)
+        first, second = order[:num_edges // 2], order[num_edges // 2:2 * (num_edges // 2)]
+        a, b, c, d = sources[first], targets[first], sources[second], targets[second]
+        valid = (a != d) & (c != b) & ~exists[a, d] & ~exists[c, b]
+        new_edges = np.concatenate([a * n + d, c * n + b])
+        _, inverse, counts = np.unique(new_edges, return_inverse=True, return_counts=True)
+        duplicated = counts[inverse] > 1
+        valid &= ~(duplicated[:len(first)] | duplicated[len(first):])
+
+        first, second = first[valid], second[valid]
+        exists[sources[first], targets[first]] = False
+        exists[sources[second], targets[second]] = False
+        targets[first], targets[second] = targets[second], targets[first].copy()
+        exists[sources[first], targets[first]] = True
+        exists[sources[second], targets[second]] = True
+        successes += np.sum(valid)
+
+    rewired = np.zeros(matrix.shape, dtype=matrix.dtype)
+    rewired[sources, targets] = values
+    return rewired
+
+
+def randomize(matrix, model, rng):
+    """Randomize the matrix with the given null model, one of NULL_MODELS"""
+    if model == "shuffle":
+        return full_shuffle(matrix, rng)
+    if model == "switch":
+        return edge_switch(matrix, rng)
+    raise ValueError(f"Null model must be one of {', '.join(NULL_MODELS)}")
+
+
+def run_batch(matrix, model, seeds, statistic=count_motifs):
+    """
+    Randomize the matrix once per seed, and compute the statistic of every randomized matrix.
+    :param seeds: SeedSequences, one per randomization
+    :return: The statistic of every randomization, (len(seeds), k)
+    """
+    return np.array([np.atleast_1d(statistic(randomize(matrix, model, np.random.default_rng(seed))))
+                     for seed in seeds])
+
+
+def null_distribution(matrix, statistic=count_motifs, model="switch", randomizations=RANDOMIZATIONS, seed=0,
+                      workers=None, batch_size=BATCH_SIZE):
+    """
+    Compute the statistic over an ensemble of randomized networks, in a process pool. Every randomization gets its own
+    seed, spawned from the given one, so the ensemble is the same no matter how it is split to batches and workers.
+    :param statistic: Function of a matrix that returns a number or a vector, must be defined at module level
+    :param model: The null model, one of NULL_MODELS
+    :param workers: Number of worker processes, defaults to the number of CPUs
+    :return: The statistic of every randomization, (randomizations, k)
+    """
+    if model not in NULL_MODELS:
+        raise ValueError(f"Null model must be one of {', '.join(NULL_MODELS)}")
+    seeds = np.random.SeedSequence(seed).spawn(randomizations)
+    batches = [seeds[start:start + batch_size] for start in range(0, randomizations, batch_size)]
+    with ProcessPoolExecutor(max_workers=workers or os.cpu_count()) as executor:
+        results = list(executor.map(run_batch, repeat(matrix), repeat(model), batches, repeat(statistic)))
+    return np.concatenate(results)
+
+
+def significance(observed, null):
+    """
+    Compare the observed statistic to its null distribution.
+    :param observed: The statistic of the real network, a number or a (k,) vector
+    :param null: The statistic of every randomization, (randomizations, k)
+    :return: Dictionary with the "mean" and "std" of the null, the "z_score" and its one sided "normal_p_value", and
+    the empirical p values of a statistic at least as large, "p_value_greater", and at least as small, "p_value_less",
+    which count the observed network as one of the ensemble so they are never 0
+    """
+    observed = np.atleast_1d(observed)
+    mean, std = np.mean(null, axis=0), np.std(null, axis=0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        z_score = (observed - mean) / std
+    return {
+        "mean": mean,
+        "std": std,
+        "z_score": z_score,
+        "normal_p_value": norm.sf(z_score),
+        "p_value_greater": (1 + np.sum(null >= observed, axis=0)) / (len(null) + 1),
+        "p_value_less": (1 + np.sum(null <= observed, axis=0)) / (len(null) + 1),
+    }
@@ -1,75 +1,14 @@
 import numpy as np
 from plotly import graph_objects as go
 
-Y_B_MAX = 10
-X_Y_KD = 0.8
-X_Z_KD = 0.7
-Y_ALPHA = 0.4
-Z_B_MAX = 10
-Y_Z_KD = 0.8
-Z_ALPHA = 0.6
-X_ALPHA = 0.6
-X_STST = 8
+from ffl_engine import make_parameters, simulate
 
+import common_path  # puts the shared modules of common/ on the path
+from render import Renderer
 
-def dy_a(x, y):
-    return Y_B_MAX * (x / (x + X_Y_KD)) - y * Y_ALPHA
 
-
-def dz_a(x, y, z):
-    numinator = (x / X_Z_KD) + (y / Y_Z_KD)
-    return Z_B_MAX * (numinator / (1 + numinator)) - (z * Z_ALPHA)
-
-def dz_c(x, y, z):
-    return Z_B_MAX * ((x / (x + X_Z_KD)) * (y / (y + Y_Z_KD))) - z * Z_ALPHA
-
-
-def dz_d(x, y, z):
-    return Z_B_MAX * ((x / (x + X_Z_KD)) - (x / (x + X_Z_KD)) * (y / (y + Y_Z_KD))) - z * Z_ALPHA
-
-
-def iteration_a(x, y, z, dt, signal):
-    if not signal:
-        x = 0
-    y_new = y + dy_a(x, y) * dt
-    z_new = z + dz_a(x, y, z) * dt
-    return y_new, z_new
-
-
-def dx_b(prev_x, signal, t):
-    if signal:
-        return X_STST * (1 - np.exp(-X_ALPHA * t))
-    else:
-        return min(prev_x, X_STST * np.exp(-X_ALPHA * t))
-
-def iteration_b(x, y, z, dt, signal, t):
-    x_new = dx_b(x, signal, t)
-    if not signal:
-        x = 0
-    y_new = y + dy_a(x, y) * dt
-    z_new = z + dz_a(x, y, z) * dt
-    return x_new, y_new, z_new
-
-
-def iteration_c(x, y, z, dt, signal):
-    if not signal:
-        x = 0
-    y_new = y + dy_a(x, y) * dt
-    z_new = z + dz_c(x, y, z) * dt
-    return y_new, z_new
-
-
-def iteration_d(x, y, z, dt, signal):
-    if not signal:
-        x = 0
-    y_new = y + dy_a(x, y) * dt
-    z_new = z + dz_d(x, y, z) * dt
-    return y_new, z_new
-
-
-
-def plot_system(x, y, z, name, dt=0.1):
-    # plot the system
+def plot_system(x, y, z, name, dt=0.1, renderer=None):
+    # plot the system, with the renderer if given, else right away
     fig = go.Figure()
     fig.add_trace(go.Scatter(x=np.arange(0, 100, dt), y=y, name="Y"))
     fig.add_trace(go.Scatter(x=np.arange(0, 100, dt), y=z, name="Z"))
@@ -79,78 +18,23 @@ def plot_system(x, y, z, name, dt=0.1):
                   x0=20*dt, y0=0, x1=20*dt, y1=15,
                   line=dict(color="black", width=2, dash="dash"))
     fig.update_layout(title=name, xaxis_title="Time", yaxis_title="Concentration")
-    fig.show()
+    renderer = Renderer(workers=0) if renderer is None else renderer
+    renderer.show(fig)
     file_name = f"ffl_{name}.png"
-    fig.write_image(format="png", engine="kaleido", file=file_name)
+    renderer.save(fig, file_name)
 
 
 if __name__ == '__main__':
-    # A
-    x = np.ones(100) * X_STST
-    y = np.zeros(100)
-    z = np.zeros(100)
-    dt = 0.1
-    for i in range(1, 100):
-        if i <= 20:
-            signal = True
-        else:
-            signal = False
-        y[i], z[i] = iteration_a(x[i], y[i - 1], z[i - 1], dt, signal)
-
-    plot_system(x, y, z, "A", dt)
-
-    # B
-    x = np.zeros(100)
-    y = np.zeros(100)
-    z = np.zeros(100)
+    # Every part is an FFL type, input logic of Z and dynamics of X, with the signal on for the first 20 steps
+    parts = {
+        "A": ("C1", "SUM", "step"),
+        "B": ("C1", "SUM", "dynamic"),
+        "C": ("C1", "AND", "step"),
+        "D": ("I1", "AND", "step"),
+    }
     dt = 0.1
-
-    signal_end = 20
-    for i in range(1, 100):
-        if i <= signal_end:
-            signal = True
-            t = i * dt
-        else:
-            signal = False
-            t = (i - signal_end) * dt
-
-        x[i], y[i], z[i] = iteration_b(x[i - 1], y[i - 1], z[i - 1], dt, signal, t)
-
-    plot_system(x, y, z, "B", dt)
-
-    # C
-    x = np.ones(100) * X_STST
-    y = np.zeros(100)
-    z = np.zeros(100)
-    dt = 0.1
-
-    for i in range(1, 100):
-        if i <= 20:
-            signal = True
-        else:
-            signal = False
-        y[i], z[i] = iteration_c(x[i - 1], y[i - 1], z[i - 1], dt, signal)
-
-    plot_system(x, y, z, "C", dt)
-
-    # D
-    x = np.ones(100) * X_STST
-    y = np.zeros(100)
-    z = np.zeros(100)
-    dt = 0.1
-
-    for i in range(1, 100):
-        if i <= 20:
-            signal = True
-        else:
-            signal = False
-        y[i], z[i] = iteration_d(x[i - 1], y[i - 1], z[i - 1], dt, signal)
-
-    plot_system(x, y, z, "D", dt)
-
-
-
-
-
-
-
+    parameters = make_parameters(pulse_length=20 * dt)
+    with Renderer() as renderer:
+        for name, (ffl_type, logic, x_mode) in parts.items():
+            trajectory = simulate(parameters, ffl_type, logic, x_mode, num_steps=100, dt=dt)
+            plot_system(trajectory["x"][0], trajectory["y"][0], trajectory["z"][0], name, dt, renderer)
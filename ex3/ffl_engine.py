@@ -0,0 +1,174 @@
+from functools import lru_cache
+
+import numpy as np
+
+import common_path  # puts the shared modules of common/ on the path
+from model_spec import Model
+
+Y_B_MAX = 10
+X_Y_KD = 0.8
+X_Z_KD = 0.7
+Y_ALPHA = 0.4
+Z_B_MAX = 10
+Y_Z_KD = 0.8
+Z_ALPHA = 0.6
+X_ALPHA = 0.6
+X_STST = 8
+
+# Sign of the X->Y, Y->Z and X->Z edges of every FFL type, 1 for activation and -1 for repression
+SIGNS = {
+    "C1": (1, 1, 1), "C2": (-1, 1, -1), "C3": (1, -1, -1), "C4": (-1, -1, 1),
+    "I1": (1, -1, 1), "I2": (-1, -1, -1), "I3": (1, 1, -1), "I4": (-1, 1, 1),
+}
+LOGICS = ("AND", "OR", "SUM")
+# "step": X is X_STST while the signal is on and 0 after it, as in parts A, C and D of ffl.py
+# "dynamic": X rises and decays exponentially, as in part B
+X_MODES = ("step", "dynamic")
+
+DEFAULT_PARAMETERS = {
+    "y_b_max": Y_B_MAX, "x_y_kd": X_Y_KD, "y_alpha": Y_ALPHA,
+    "z_b_max": Z_B_MAX, "x_z_kd": X_Z_KD, "y_z_kd": Y_Z_KD, "z_alpha": Z_ALPHA,
+    "x_alpha": X_ALPHA, "x_stst": X_STST,
+    "pulse_length": 2,
+}
+DT = 0.1
+NUM_STEPS = 100
+# Z responds once it reaches this fraction of its response to a long pulse
+RESPONSE_FRACTION = 0.5
+
+
+def make_parameters(n=None, **overrides):
+    """Parameters of a batch of FFLs, every one an (n,) array, n defaults to the length of the longest override"""
+    unknown = set(overrides) - set(DEFAULT_PARAMETERS)
+    if unknown:
+        raise ValueError(f"Unknown parameters: {', '.join(sorted(unknown))}")
+    if n is None:
+        n = max([np.size(value) for value in overrides.values()], default=1)
+    return {name: np.broadcast_to(np.asarray(overrides.get(name, default), dtype=float), (n,)).copy()
+            for name, default in DEFAULT_PARAMETERS.items()}
+
+
+def grid(**ranges):
+    """Parameters of a batch holding every combination of the given values of the parameters"""
+    names = list(ranges)
+    values = np.meshgrid(*[np.asarray(ranges[name], dtype=float) for name in names], indexing="ij")
+    return make_parameters(**{name: value.ravel() for name, value in zip(names, values)})
+
+
+def regulation(u, kd, sign):
+    # the rate law of the fraction of the maximal effect of u, rising with u for an activator and falling for a
+    # repressor
+    activation = f"{u} / ({u} + {kd})"
+    return activation if sign > 0 else f"(1 - {activation})"
+
+
+def combine(gx, gy, logic):
+    # the rate law of the input function of Z from the regulation by X and by Y
+    if logic == "AND":
+        return f"{gx} * {gy}"
+    if logic == "OR":
+        return f"(1 - (1 - {gx}) * (1 - {gy}))"
+    if logic == "SUM":
+        # (x / Kxz + y / Kyz) / (1 + x / Kxz + y / Kyz) of ffl.dz_a, written with the regulation of each input, so
+        # repressors fit too. It is 1 when both inputs are at full effect
+        return (f"Piecewise((({gx} + {gy} - 2 * {gx} * {gy}) / (1 - {gx} * {gy}), 1 - {gx} * {gy} > 0), "
+                f"(1, True))")
+    raise ValueError(f"Logic must be one of {', '.join(LOGICS)}")
+
+
+@lru_cache(maxsize=None)
+def ffl_model(signs, logic):
+    """The model of Y and Z of an FFL with the given signs of its edges and logic, X is a parameter, as it is an input"""
+    xy_sign, yz_sign, xz_sign = signs
+    rates = {
+        "y": f"y_b_max * {regulation('x', 'x_y_kd', xy_sign)} - y_alpha * y",
+        "z": f"z_b_max * {combine(regulation('x', 'x_z_kd', xz_sign), regulation('y', 'y_z_kd', yz_sign), logic)}"
+             f" - z_alpha * z",
+    }
+    name = "ffl_" + "".join("+" if sign > 0 else "-" for sign in signs) + f"_{logic}"
+    return Model(name, ("y", "z"), ("x", "y_b_max", "x_y_kd", "y_alpha", "z_b_max", "x_z_kd", "y_z_kd", "z_alpha"),
+                 rates)
+
+
+def simulate(parameters, ffl_type="C1", logic="AND", x_mode="step", num_steps=NUM_STEPS, dt=DT):
+    """
+    Simulate a batch of FFLs with forward Euler, all members together. The signal is on for the first pulse_length of
+    time of every member, X acts on Y and Z only while it is on, as in ffl.py.
+    :param ffl_type: A type of SIGNS, or a tuple of the signs of the X->Y, Y->Z and X->Z edges
+    :return: Dictionary with the "time" (t,) and "x", "y", "z" and "signal" as (n, t) arrays
+    """
+    if x_mode not in X_MODES:
+        raise ValueError(f"X mode must be one of {', '.join(X_MODES)}")
+    model = ffl_model(tuple(SIGNS[ffl_type] if isinstance(ffl_type, str) else ffl_type), logic)
+    p = parameters
+    n = len(p["x_stst"])
+    pulse_steps = np.rint(p["pulse_length"] / dt)
+
+    trajectory = {name: np.zeros((n, num_steps)) for name in ("x", "y", "z", "signal")}
+    x = p["x_stst"] if x_mode == "step" else np.zeros(n)
+    y, z = np.zeros(n), np.zeros(n)
+    trajectory["x"][:, 0] = x
+    for i in range(1, num_steps):
+        signal = i <= pulse_steps
+        if x_mode == "dynamic":
+            rising = p["x_stst"] * (1 - np.exp(-p["x_alpha"] * i * dt))
+            decaying = np.minimum(x, p["x_stst"] * np.exp(-p["x_alpha"] * (i - pulse_steps) * dt))
+            x_new = np.where(signal, rising, decaying)
+        else:
+            x_new = x
+        y_rate, z_rate = model.rhs((y, z), dict(p, x=np.where(signal, x, 0)))
+        x, y, z = x_new, y + y_rate * dt, z + z_rate * dt
+        trajectory["x"][:, i], trajectory["y"][:, i], trajectory["z"][:, i] = x, y, z
+        trajectory["signal"][:, i] = signal
+
+    trajectory["time"] = np.arange(num_steps) * dt
+    return trajectory
+
+
+def first_time(mask, time):
+    # the first time every row of mask is True, nan if it never is
+    found = np.any(mask, axis=1)
+    return np.where(found, time[np.argmax(mask, axis=1)], np.nan)
+
+
+def response_metrics(trajectory, fraction=RESPONSE_FRACTION):
+    """
+    Response metrics of every member of a simulated batch, measured on Z relative to its baseline at time 0:
+    "amplitude", the largest change of Z, "peak_time", when it is reached,
+    "on_delay", the time from the signal until Z changes by fraction of the amplitude,
+    "off_delay", the time from the end of the signal until Z returns within fraction of its change at that point,
+    nan if it doesn't within the run.
+    :return: Dictionary of metric name to an (n,) array
+    """
+    time, z, signal = trajectory["time"], trajectory["z"], trajectory["signal"]
+    change = z - z[:, :1]
+    peak = np.argmax(np.abs(change), axis=1)
+    amplitude = change[np.arange(len(z)), peak]
+    on_delay = first_time(np.abs(change) >= fraction * np.abs(amplitude)[:, None], time)
+
+    # the last step with the signal on, Z is measured from there on
+    pulse_end = np.where(np.any(signal > 0, axis=1), signal.shape[1] - 1 - np.argmax(signal[:, ::-1] > 0, axis=1), 0)
+    at_end = change[np.arange(len(z)), pulse_end]
+    after = time[None, :] > time[pulse_end][:, None]
+    returned = after & (np.abs(change) <= (1 - fraction) * np.abs(at_end)[:, None])
+    off_delay = first_time(returned, time) - time[pulse_end]
+    return {"amplitude": amplitude, "peak_time": time[peak], "on_delay": on_delay, "off_delay": off_delay}
+
+
+def persistence_threshold(parameters, pulse_lengths, ffl_type="C1", logic="AND", x_mode="step",
+                          fraction=RESPONSE_FRACTION, num_steps=NUM_STEPS, dt=DT):
+    """
+    The shortest pulse of the signal that every member responds to, by simulating every member with every pulse
+    length in one batch. A member responds once the amplitude of Z reaches fraction of its amplitude for the longest
+    pulse, so a coherent AND FFL, which filters short pulses, has a long threshold.
+    :param pulse_lengths: The pulse lengths to try, increasing
+    :return: The threshold of every member, (n,), nan if it doesn't respond to any pulse
+    """
+    n, m = len(parameters["x_stst"]), len(pulse_lengths)
+    batch = {name: np.repeat(values, m) for name, values in parameters.items()}
+    batch["pulse_length"] = np.tile(np.asarray(pulse_lengths, dtype=float), n)
+    amplitude = np.abs(response_metrics(simulate(batch, ffl_type, logic, x_mode, num_steps, dt), fraction)
+                       ["amplitude"]).reshape(n, m)
+    responds = amplitude >= fraction * amplitude[:, -1:]
+    responds &= amplitude[:, -1:] > 0
+    return first_time(responds, np.asarray(pulse_lengths, dtype=float))
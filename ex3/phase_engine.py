@@ -0,0 +1,168 @@
+import numpy as np
+from contourpy import contour_generator
+
+NEWTON_SEEDS = 40  # per axis
+NEWTON_ITERATIONS = 50
+TOLERANCE = 1e-9
+NULLCLINE_RESOLUTION = 800  # per axis
+BASIN_RESOLUTION = 200  # per axis
+BASIN_TIME = 20
+BASIN_DT = 0.01
+# states that get further than this from the region, relative to its size, are counted as diverged
+ESCAPE_FACTOR = 10
+
+
+def jacobian(field, x, y, h=1e-6):
+    # the jacobian of the field at every point by central differences, (..., 2, 2) where [i, j] is d field_i / d var_j
+    dx_plus, dx_minus = np.array(field(x + h, y)), np.array(field(x - h, y))
+    dy_plus, dy_minus = np.array(field(x, y + h)), np.array(field(x, y - h))
+    by_x, by_y = (dx_plus - dx_minus) / (2 * h), (dy_plus - dy_minus) / (2 * h)
+    return np.moveaxis(np.array([[by_x[0], by_y[0]], [by_x[1], by_y[1]]]), (0, 1), (-2, -1))
+
+
+def find_equilibria(field, x_range, y_range, seeds=NEWTON_SEEDS, iterations=NEWTON_ITERATIONS, tolerance=TOLERANCE,
+                    field_jacobian=None):
+    """
+    Find the equilibria of a 2-D vector field in a region, by Newton's method from a grid of seeds, all at once.
+    :param field: Function of arrays x, y that returns the derivatives (dx, dy)
+    :param field_jacobian: Function of arrays x, y that returns the exact jacobian of the field, (..., 2, 2), defaults
+    to central differences
+    :param x_range: The (min, max) of x of the region, and y_range the same for y
+    :return: The equilibria, (k, 2), sorted by x
+    """
+    x, y = np.meshgrid(np.linspace(*x_range, seeds), np.linspace(*y_range, seeds))
+    x, y = x.ravel(), y.ravel()
+    with np.errstate(all="ignore"):
+        for _ in range(iterations):
+            u, v = field(x, y)
+            jac = jacobian(field, x, y) if field_jacobian is None else field_jacobian(x, y)
+            det = jac[:, 0, 0] * jac[:, 1, 1] - jac[:, 0, 1] * jac[:, 1, 0]
+            # the solution of jac @ step = -(u, v), written out for 2x2
+            step_x = (-u * jac[:, 1, 1] + v * jac[:, 0, 1]) / det
+            step_y = (-v * jac[:, 0, 0] + u * jac[:, 1, 0]) / det
+            x, y = x + step_x, y + step_y
+        u, v = field(x, y)
+        scale = max(np.ptp(x_range), np.ptp(y_range))
+        found = (np.isfinite(x) & np.isfinite(y) & (np.hypot(u, v) <= tolerance * 1e3 * (1 + scale))
+                 & (x >= x_range[0]) & (x <= x_range[1]) & (y >= y_range[0]) & (y <= y_range[1]))
+    points = np.column_stack([x[found], y[found]])
+
+    # many seeds converge to every equilibrium, keep one of every cluster
+    points = points[np.lexsort((points[:, 1], points[:, 0]))]
+    unique = []
+    for point in points:
+        if not unique or np.min(np.hypot(*(np.array(unique) - point).T)) > 1e-6 * (1 + scale):
+            unique.append(point)
+    return np.array(unique).reshape(-1, 2)
+
+
+def classify(jac, tolerance=1e-9):
+    """
+    The type of every equilibrium from the trace and determinant of its jacobian.
+    :param jac: The jacobians, (k, 2, 2)
+    :return: List of types: "saddle", "stable node", "unstable node", "stable focus", "unstable focus", "center" or
+    "degenerate"
+    """
+    trace = jac[:, 0, 0] + jac[:, 1, 1]
+    det = jac[:, 0, 0] * jac[:, 1, 1] - jac[:, 0, 1] * jac[:, 1, 0]
+    discriminant = trace ** 2 - 4 * det
+    types = []
+    for t, d, disc in zip(trace, det, discriminant):
+        if abs(d) <= tolerance:
+            types.append("degenerate")
+        elif d < 0:
+            types.append("saddle")
+        elif abs(t) <= tolerance:
+            types.append("center")
+        else:
+            stability = "stable" if t < 0 else "unstable"
+            types.append(f"{stability} {'node' if disc >= 0 else 'focus'}")
+    return types
+
+
+def nullclines(field, x_range, y_range, resolution=NULLCLINE_RESOLUTION, pole_factor=1e-2):
+    """
+    The nullclines of the field, the zero contours of dx and of dy on a fine grid. A field with a pole changes sign
+    across it without passing through zero, which the contour would mistake for a crossing, so vertices where the
+    field is far from zero are cut out of the lines.
+    :param pole_factor: Largest value of the field on a vertex, relative to the largest change of the field between
+    two neighbouring grid points, that counts as zero
+    :return: For dx and for dy, a list of lines, each (m, 2)
+    """
+    x, y = np.meshgrid(np.linspace(*x_range, resolution), np.linspace(*y_range, resolution))
+    with np.errstate(all="ignore"):
+        values = field(x, y)
+    result = []
+    for k, value in enumerate(values):
+        value = np.where(np.isfinite(value), value, np.nan)
+        # the typical change of the field between neighbouring grid points, a contour vertex is within that of zero
+        step = np.nanmedian(np.abs(np.diff(value, axis=1))) + np.nanmedian(np.abs(np.diff(value, axis=0)))
+        lines = []
+        for line in contour_generator(x, y, value).lines(0):
+            with np.errstate(all="ignore"):
+                on_curve = np.abs(np.asarray(field(line[:, 0], line[:, 1]))[k]) <= step / pole_factor
+            # split the line where it leaves the curve
+            edges = np.flatnonzero(np.diff(np.concatenate([[0], on_curve.astype(int), [0]])))
+            lines.extend(line[start:stop] for start, stop in zip(edges[::2], edges[1::2]) if stop - start > 1)
+        result.append(lines)
+    return result
+
+
+def basins(field, equilibria, x_range, y_range, resolution=BASIN_RESOLUTION, run_time=BASIN_TIME, dt=BASIN_DT,
+           radius=None):
+    """
+    The basin of attraction of every stable equilibrium, by integrating a grid of initial conditions together with
+    RK4, and finding where every one of them ends.
+    :param equilibria: The equilibria, (k, 2), as found by find_equilibria
+    :param radius: Distance from an equilibrium at which a state counts as converged, defaults to 1% of the region
+    :return: The grid x and y, (resolution, resolution) each, and the index of the equilibrium every initial condition
+    converges to, -1 if it diverges or converges to none of them
+    """
+    x, y = np.meshgrid(np.linspace(*x_range, resolution), np.linspace(*y_range, resolution))
+    state = np.array([x.ravel(), y.ravel()])
+    scale = max(np.ptp(x_range), np.ptp(y_range))
+    radius = 0.01 * scale if radius is None else radius
+    center = np.array([np.mean(x_range), np.mean(y_range)])[:, None]
+    running = np.ones(state.shape[1], dtype=bool)
+
+    def derivative(s):
+        return np.array(field(s[0], s[1]))
+
+    with np.errstate(all="ignore"):
+        for _ in range(int(round(run_time / dt))):
+            s = state[:, running]
+            k1 = derivative(s)
+            k2 = derivative(s + dt / 2 * k1)
+            k3 = derivative(s + dt / 2 * k2)
+            k4 = derivative(s + dt * k3)
+            s = s + dt / 6 * (k1 + 2 * k2 + 2 * k3 + k4)
+            state[:, running] = s
+            # diverged states are frozen away from every equilibrium
+            escaped = ~np.all(np.isfinite(s), axis=0) | (np.max(np.abs(s - center), axis=0) > ESCAPE_FACTOR * scale)
+            state[:, np.flatnonzero(running)[escaped]] = np.inf
+            running[np.flatnonzero(running)[escaped]] = False
+            if not np.any(running):
+                break
+
+    basin = np.full(state.shape[1], -1)
+    if len(equilibria):
+        distance = np.hypot(state[0][:, None] - equilibria[:, 0], state[1][:, None] - equilibria[:, 1])
+        nearest = np.argmin(distance, axis=1)
+        converged = distance[np.arange(len(nearest)), nearest] <= radius
+        basin[converged] = nearest[converged]
+    return x, y, basin.reshape(x.shape)
+
+
+def analyze(field, x_range, y_range, basin_resolution=BASIN_RESOLUTION, field_jacobian=None):
+    """
+    The full phase plane analysis of a 2-D vector field in a region.
+    :param field_jacobian: The exact jacobian of the field, as in find_equilibria
+    :return: Dictionary with the "equilibria" (k, 2), their "types" and "jacobians", the "nullclines" of dx and dy,
+    and the "basins" grid as returned by basins
+    """
+    equilibria = find_equilibria(field, x_range, y_range, field_jacobian=field_jacobian)
+    jacobians = (jacobian(field, equilibria[:, 0], equilibria[:, 1]) if field_jacobian is None
+                 else field_jacobian(equilibria[:, 0], equilibria[:, 1]))
+    return {"equilibria": equilibria, "jacobians": jacobians, "types": classify(jacobians),
+            "nullclines": nullclines(field, x_range, y_range),
+            "basins": basins(field, equilibria, x_range, y_range, basin_resolution)}
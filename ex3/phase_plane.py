@@ -3,11 +3,11 @@ from plotly import graph_objects as go
 import plotly.figure_factory as ff
 import matplotlib.pyplot as plt
 
-def dx(x, y):
-    return 3 * x - (2 * x * y) + y
+import common_path  # puts the shared modules of common/ on the path
+from model_spec import Model
+from render import batch_mode
 
-def dy(x, y):
-    return x - (y ** 2) + 2
+MODEL = Model("phase_plane", ("x", "y"), (), {"x": "3 * x - (2 * x * y) + y", "y": "x - (y ** 2) + 2"})
 
 def dx_nullcline(x):
     return (3 * x) / (2 * x - 1)
@@ -16,48 +16,52 @@ def dy_nullcline(x):
     return np.sqrt(x + 2)
 
 
+def field(x, y):
+    return MODEL.rhs((x, y), {})
+
+
+def field_jacobian(x, y):
+    return np.moveaxis(MODEL.jacobian((x, y), {}), (0, 1), (-2, -1))
+
+
 if __name__ == '__main__':
-    x = np.linspace(-4, 4, 25)
-    y = np.linspace(-3, 3, 12)
+    from phase_engine import analyze
 
-    X, Y = np.meshgrid(x, y)
+    x_range, y_range = (-4, 4), (-3, 3)
+    analysis = analyze(field, x_range, y_range, field_jacobian=field_jacobian)
 
-    Z = dx(X, Y)
-    W = dy(X, Y)
     fig, ax = plt.subplots()
+    # shade the basin of attraction of every stable equilibrium
+    basin_x, basin_y, basin = analysis["basins"]
+    if np.any(basin >= 0):
+        ax.contourf(basin_x, basin_y, np.ma.masked_less(basin, 0), levels=np.arange(-0.5, len(analysis["equilibria"])),
+                    cmap='Pastel1', alpha=0.5)
+
+    X, Y = np.meshgrid(np.linspace(*x_range, 33), np.linspace(*y_range, 25))
+    Z, W = field(X, Y)
     ax.quiver(X, Y, Z, W)
 
-    # add the nullclines
-    x_null_x1 = np.linspace(-3, 0.5, 50)
-    y_1 = dx_nullcline(x_null_x1)
-    x_null_x2 = np.linspace(0.51, 3, 50)
-    y_2 = dx_nullcline(x_null_x2)
-    # concatenate the two parts, putting none in the middle, so that the line is not connected
-    x_null_x = np.concatenate((x_null_x1, [0.5], x_null_x2))
-    y_null_y = np.concatenate((y_1, [None], y_2))
-
-    # plot with matplotlib
-    ax.plot(x_null_x, y_null_y, label='dx nullcline', color='red')
-    ax.plot(x, dy_nullcline(x), label='dy first nullcline', color='royalblue')
-    ax.plot(x, -dy_nullcline(x), label='dy second nullcline', color='darkviolet')
+    # add the nullclines, found by contouring the field, so the pole of the dx nullcline splits it by itself
+    for name, lines, color in zip(('dx', 'dy'), analysis["nullclines"], ('red', 'royalblue')):
+        for i, line in enumerate(lines):
+            ax.plot(line[:, 0], line[:, 1], color=color, label=f'{name} nullcline' if i == 0 else None)
     ax.set_xlabel('x')
     ax.set_ylabel('y')
     ax.set_title('Phase Plane of the given system of differential equations')
-    ax.legend()
     # set limits for the plot
-    ax.set_xlim(-4, 4)
-    ax.set_ylim(-3, 3)
+    ax.set_xlim(*x_range)
+    ax.set_ylim(*y_range)
     # draw X and Y axes
     ax.axhline(0, color='black', lw=1)
     ax.axvline(0, color='black', lw=1)
-    # Add the equilibrium points
-    ax.plot(2, 2, 'ro')
-    ax.plot(-1, 1, 'ro')
-    ax.plot(0.25, -1.5, 'ro')
+    # Add the equilibrium points, with their type
+    for (x_eq, y_eq), eq_type in zip(analysis["equilibria"], analysis["types"]):
+        print(f"Equilibrium at ({x_eq:.3f}, {y_eq:.3f}): {eq_type}")
+        ax.plot(x_eq, y_eq, 'ro')
+        ax.annotate(eq_type, (x_eq, y_eq), textcoords='offset points', xytext=(6, 6))
+    ax.legend()
     # increase the size of the plot, and save it
     fig.set_size_inches(10, 7)
-    plt.show()
+    if not batch_mode():
+        plt.show()
     fig.savefig('phase_plane.png')
-
-
-
@@ -0,0 +1,161 @@
+import os
+
+import numpy as np
+
+import common_path  # puts the shared modules of common/ on the path
+from bits import POPCOUNT_TABLE
+from cache import cache_base, is_valid, write_metadata
+
+DATA_PATH = "data/brca_clinical.txt"
+CACHE_DIRECTORY = ".clinical_cache"
+ID_COLUMN = "Sample_ID"
+# short names of the categorical columns of brca_clinical.txt
+COLUMNS = {
+    "stage": "Neoplasm_Disease_Stage_American_Joint_Committee_on_Cancer_Code",
+    "cancer_type": "Cancer_Type_Detailed",
+    "subtype": "Subtype",
+}
+MISSING_VALUES = ("NA", "")
+# code of a missing value, it is in no category and in no bitmap
+MISSING = -1
+
+
+def cache_paths(path):
+    """The paths of the cached table and its metadata, in a cache directory next to the source file"""
+    base = cache_base(path, CACHE_DIRECTORY)
+    return base + ".npz", base + ".json"
+
+
+def encode(values):
+    """
+    Dictionary encode a column: every distinct value gets a code, by the sorted order of the values.
+    :return: The categories, and the code of every row, MISSING for the values of MISSING_VALUES
+    """
+    values = np.asarray(values)
+    present = ~np.isin(values, MISSING_VALUES)
+    categories, codes = np.unique(values[present], return_inverse=True)
+    # the smallest integer type that holds every code and MISSING
+    dtype = np.int8 if len(categories) < 2 ** 7 else np.int16 if len(categories) < 2 ** 15 else np.int32
+    encoded = np.full(len(values), MISSING, dtype=dtype)
+    encoded[present] = codes
+    return categories, encoded
+
+
+def pack_bitmaps(codes, num_categories):
+    """The bitmap of the rows of every category, packed to bits, (num_categories, ceil(rows / 8)) uint8"""
+    return np.packbits(codes[None, :] == np.arange(num_categories, dtype=codes.dtype)[:, None], axis=1)
+
+
+def parse(path):
+    """
+    Parse the tab separated text of a clinical table, the sample IDs and every column of COLUMNS.
+    :return: Dictionary with the "ids", and the "<name>_categories" and "<name>_codes" of every column
+    """
+    table = np.loadtxt(path, dtype=str, delimiter="\t", ndmin=2, comments=None)
+    header, rows = list(table[0]), table[1:]
+    missing = [column for column in [ID_COLUMN] + list(COLUMNS.values()) if column not in header]
+    if missing:
+        raise ValueError(f"{path} has no column {', '.join(missing)}")
+    ids = rows[:, header.index(ID_COLUMN)]
+    if len(np.unique(ids)) != len(ids):
+        raise ValueError(f"{path} has repeated sample IDs")
+    arrays = {"ids": ids}
+    for name, column in COLUMNS.items():
+        arrays[f"{name}_categories"], arrays[f"{name}_codes"] = encode(rows[:, header.index(column)])
+    return arrays
+
+
+class ClinicalTable:
+    """
+    The clinical table, with every column dictionary encoded to integer codes, a hash index from sample ID to row, and
+    a packed bitmap of the rows of every category, so counts, contingency tables and subsets are computed with bitwise
+    operations on the bitmaps instead of scanning the rows.
+    """
+    def __init__(self, ids, categories, codes):
+        """
+        :param ids: The sample ID of every row
+        :param categories: Column name to its categories
+        :param codes: Column name to the code of every row, MISSING for missing values
+        """
+        self.ids = np.asarray(ids)
+        self.index = {sample: row for row, sample in enumerate(self.ids.tolist())}
+        self.categories = {name: tuple(values.tolist()) for name, values in categories.items()}
+        self.codes = codes
+        self.bitmaps = {name: pack_bitmaps(codes[name], len(self.categories[name])) for name in codes}
+        self.all_rows = np.packbits(np.ones(len(self.ids), dtype=bool))
+
+    def __len__(self):
+        return len(self.ids)
+
+    def rows(self, ids):
+        """The row of every sample ID, -1 for IDs that are not in the table, for joining other tables by sample"""
+        return np.array([self.index.get(sample, -1) for sample in ids], dtype=np.int64)
+
+    def category_codes(self, column, values):
+        """The codes of the given categories of a column, a category or a list of them"""
+        values = [values] if isinstance(values, str) else values
+        unknown = [value for value in values if value not in self.categories[column]]
+        if unknown:
+            raise ValueError(f"Unknown {column} categories: {', '.join(unknown)}")
+        return [self.categories[column].index(value) for value in values]
+
+    def mask(self, **conditions):
+        """
+        The packed bitmap of the rows that meet every condition.
+        :param conditions: Column name to the category, or list of categories, its rows may have
+        """
+        mask = self.all_rows.copy()
+        for column, values in conditions.items():
+            mask &= np.bitwise_or.reduce(self.bitmaps[column][self.category_codes(column, values)], axis=0)
+        return mask
+
+    def subset(self, mask=None, **conditions):
+        """The rows of a mask, or of the rows that meet the conditions of mask()"""
+        mask = self.mask(**conditions) if mask is None else mask
+        return np.flatnonzero(np.unpackbits(mask, count=len(self)))
+
+    def counts(self, column, mask=None):
+        """The number of rows of every category of a column, within a mask, (num_categories,)"""
+        bitmaps = self.bitmaps[column] if mask is None else self.bitmaps[column] & mask
+        return POPCOUNT_TABLE[bitmaps].sum(axis=1, dtype=np.int64)
+
+    def contingency(self, row_column, column_column, mask=None):
+        """
+        The contingency table of two columns, within a mask. Rows missing either value are not counted.
+        :return: The number of rows of every pair of categories, (row categories, column categories)
+        """
+        column_bitmaps = self.bitmaps[column_column] if mask is None else self.bitmaps[column_column] & mask
+        both = self.bitmaps[row_column][:, None, :] & column_bitmaps[None, :, :]
+        return POPCOUNT_TABLE[both].sum(axis=2, dtype=np.int64)
+
+
+def load_clinical(path=DATA_PATH):
+    """
+    Load a clinical table through the binary cache. The text is parsed only the first time, or when the file changed,
+    and otherwise the encoded columns are read from the cached .npz.
+    :return: The ClinicalTable
+    """
+    data_path, metadata_path = cache_paths(path)
+    if not is_valid(metadata_path, path):
+        arrays = parse(path)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        np.savez(data_path, **arrays)
+        # the metadata is written last, so a cache without it is never used
+        write_metadata(metadata_path, path)
+    with np.load(data_path) as arrays:
+        return ClinicalTable(arrays["ids"], {name: arrays[f"{name}_categories"] for name in COLUMNS},
+                             {name: arrays[f"{name}_codes"] for name in COLUMNS})
+
+
+if __name__ == '__main__':
+    table = load_clinical()
+    print(f"{len(table)} samples")
+    for name in COLUMNS:
+        counts = table.counts(name)
+        print(f"{name}: " + ", ".join(f"{category} {count}" for category, count in zip(table.categories[name], counts))
+              + f", missing {len(table) - np.sum(counts)}")
+    print("Stage by subtype:")
+    print(table.contingency("stage", "subtype"))
+    ductal = table.mask(cancer_type="Breast_Invasive_Ductal_Carcinoma")
+    print("Stage by subtype, ductal carcinomas only:")
+    print(table.contingency("stage", "subtype", ductal))
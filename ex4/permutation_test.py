@@ -0,0 +1,148 @@
+import numpy as np
+
+from clinical import MISSING, load_clinical
+
+STATISTICS = ("chi2", "mi")
+CORRECTIONS = ("bh", "holm")
+MAX_PERMUTATIONS = 10000
+BATCH_SIZE = 1000
+# a test stops once this many permutations reach its observed statistic, the sequential rule of Besag and Clifford.
+# The stopped p value has a relative standard error of about 1 / sqrt(EXCEEDANCES), 10% here
+EXCEEDANCES = 100
+
+
+def contingency_tables(x, y, num_x, num_y):
+    """
+    The contingency tables of x against every row of y, all at once.
+    :param x: Codes of the first variable, (m,)
+    :param y: Codes of the second variable, (m,) or a batch of them, (b, m)
+    :return: The tables, (b, num_x, num_y)
+    """
+    y = np.atleast_2d(y)
+    cells = num_x * num_y
+    flat = x[None, :] * num_y + y + cells * np.arange(len(y))[:, None]
+    return np.bincount(flat.ravel(), minlength=cells * len(y)).reshape(len(y), num_x, num_y)
+
+
+def chi_square(tables):
+    """Pearson's chi square statistic of every table, (b,). The margins are the same for all permutations"""
+    total = tables[0].sum()
+    expected = tables[0].sum(axis=1)[:, None] * tables[0].sum(axis=0)[None, :] / total
+    return np.sum((tables - expected) ** 2 / expected, axis=(1, 2))
+
+
+def mutual_information(tables):
+    """The mutual information of the two variables of every table, in nats, (b,)"""
+    total = tables[0].sum()
+    independent = tables[0].sum(axis=1)[:, None] * tables[0].sum(axis=0)[None, :]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        terms = tables / total * np.log(tables * total / independent)
+    return np.sum(np.where(tables > 0, terms, 0), axis=(1, 2))
+
+
+STATISTIC_FUNCTIONS = {"chi2": chi_square, "mi": mutual_information}
+
+
+def permutation_test(x, y, statistic="chi2", max_permutations=MAX_PERMUTATIONS, batch_size=BATCH_SIZE,
+                     exceedances=EXCEEDANCES, rng=None):
+    """
+    Test the association of two categorical variables by permuting the labels of y, a batch of permutations at a time,
+    as a (batch_size, m) index array. Following Besag and Clifford, the test stops at the permutation where
+    exceedances permuted statistics have reached the observed one, with the p value exceedances / permutations, so
+    a test with p value p stops after about exceedances / p permutations, e.g. 200 for p = 0.5 and 2500 for p = 0.04.
+    Otherwise it runs all of max_permutations, and the p value counts the observed labels as one of the permutations,
+    so it is never 0.
+    :param x: Codes of the first variable, (m,), without missing values
+    :param y: Codes of the second variable, (m,), without missing values
+    :param statistic: One of STATISTICS
+    :return: Dictionary with the observed "statistic", the "p_value", the number of "permutations" made, and whether
+    the test "stopped_early"
+    """
+    if statistic not in STATISTICS:
+        raise ValueError(f"Statistic must be one of {', '.join(STATISTICS)}")
+    rng = np.random.default_rng(rng)
+    # keep only the categories that occur, so every margin is positive
+    _, x = np.unique(x, return_inverse=True)
+    _, y = np.unique(y, return_inverse=True)
+    num_x, num_y = x.max(initial=-1) + 1, y.max(initial=-1) + 1
+    function = STATISTIC_FUNCTIONS[statistic]
+    observed = function(contingency_tables(x, y, num_x, num_y))[0]
+    if num_x < 2 or num_y < 2:
+        return {"statistic": observed, "p_value": 1.0, "permutations": 0, "stopped_early": False}
+
+    permutations, reached = 0, 0
+    # the permuted statistics are compared with a relative tolerance, so ties that differ by rounding count as reached
+    threshold = observed - 1e-9 * abs(observed)
+    while permutations < max_permutations:
+        size = min(batch_size, max_permutations - permutations)
+        indices = rng.permuted(np.broadcast_to(np.arange(len(y)), (size, len(y))), axis=1)
+        hits = np.cumsum(function(contingency_tables(x, y[indices], num_x, num_y)) >= threshold)
+        if reached + hits[-1] >= exceedances:
+            permutations += int(np.argmax(reached + hits >= exceedances)) + 1
+            return {"statistic": observed, "p_value": exceedances / permutations, "permutations": permutations,
+                    "stopped_early": True}
+        reached += int(hits[-1])
+        permutations += size
+    return {"statistic": observed, "p_value": (1 + reached) / (1 + permutations), "permutations": permutations,
+            "stopped_early": False}
+
+
+def adjust_p_values(p_values, method="bh"):
+    """
+    Correct the p values of a family of tests for multiple testing.
+    :param method: "bh" for the false discovery rate of Benjamini and Hochberg, "holm" for the family wise error rate
+    of Holm
+    :return: The adjusted p values, in the order of p_values
+    """
+    if method not in CORRECTIONS:
+        raise ValueError(f"Correction must be one of {', '.join(CORRECTIONS)}")
+    p_values = np.asarray(p_values, dtype=float)
+    m = len(p_values)
+    order = np.argsort(p_values)
+    ranked = p_values[order]
+    if method == "bh":
+        # the smallest adjusted value of any larger p value, from the largest down
+        adjusted = np.minimum.accumulate((ranked * m / np.arange(1, m + 1))[::-1])[::-1]
+    else:
+        adjusted = np.maximum.accumulate(ranked * (m - np.arange(m)))
+    result = np.empty(m)
+    result[order] = np.minimum(adjusted, 1)
+    return result
+
+
+def association_tests(table, tests, statistic="chi2", correction="bh", seed=0, **options):
+    """
+    Run a family of association tests on a clinical table, and correct their p values together.
+    :param table: A clinical.ClinicalTable
+    :param tests: List of (row column, column column, conditions), where conditions is a dictionary for
+    ClinicalTable.mask that selects the subgroup to test in, or None for all the samples
+    :param options: Options of permutation_test
+    :return: The result of permutation_test for every test, with its "adjusted_p_value" and "samples"
+    """
+    # every test gets its own seed, spawned from the given one, so its result doesn't depend on the other tests
+    seeds = np.random.SeedSequence(seed).spawn(len(tests))
+    results = []
+    for (first, second, conditions), test_seed in zip(tests, seeds):
+        rows = table.subset(**(conditions or {}))
+        x, y = table.codes[first][rows], table.codes[second][rows]
+        present = (x != MISSING) & (y != MISSING)
+        result = permutation_test(x[present], y[present], statistic, rng=np.random.default_rng(test_seed), **options)
+        result["samples"] = int(np.sum(present))
+        results.append(result)
+    for result, adjusted in zip(results, adjust_p_values([result["p_value"] for result in results], correction)):
+        result["adjusted_p_value"] = adjusted
+    return results
+
+
+if __name__ == '__main__':
+    clinical = load_clinical()
+    tests = [("subtype", "stage", None), ("subtype", "cancer_type", None), ("stage", "cancer_type", None)]
+    tests += [("subtype", "stage", {"cancer_type": cancer_type}) for cancer_type in
+              ("Breast_Invasive_Ductal_Carcinoma", "Breast_Invasive_Lobular_Carcinoma")]
+    for statistic in STATISTICS:
+        print(f"{statistic}, p values corrected with Benjamini-Hochberg:")
+        for (first, second, conditions), result in zip(tests, association_tests(clinical, tests, statistic)):
+            subgroup = f" in {', '.join(conditions.values())}" if conditions else ""
+            print(f"    {first} vs {second}{subgroup}: {result['samples']} samples, statistic "
+                  f"{result['statistic']:.3f}, p value {result['p_value']:.4f} after {result['permutations']} "
+                  f"permutations, adjusted {result['adjusted_p_value']:.4f}")